@@ -1,5 +1,6 @@
 from flask import Flask, render_template, jsonify, request, send_file
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, lambda_stmt
 from datetime import datetime, date
 import tempfile
 from reportlab.pdfgen import canvas
@@ -7,9 +8,28 @@ from reportlab.lib.pagesizes import A4
 from reportlab.lib.units import mm
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
+import atexit
+import base64
+import binascii
+import bisect
+import csv
+import functools
+import hashlib
+import io
+import itertools
+import math
 import os
+import queue
+import re
+import shutil
+import socket
 import subprocess
 import sys
+import threading
+import time
+import types
+import zlib
+from collections import Counter, OrderedDict
 
 # 嘗試導入 PIL/ImageFont 用於 ZPL 圖形模式
 try:
@@ -19,6 +39,39 @@ except ImportError:
     IMAGE_AVAILABLE = False
     print("警告：PIL/Pillow 套件未安裝，ZPL 圖形模式將不可用")
 
+# 嘗試導入 NumPy 用於加速 ZPL 圖形轉換
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+    print("警告：numpy 套件未安裝，ZPL 圖形轉換將使用較慢的純 Python 模式")
+
+# 嘗試導入 rapidfuzz 用於試劑名稱模糊比對
+try:
+    from rapidfuzz import process as fuzzy_process
+    from rapidfuzz.distance import LCSseq
+    RAPIDFUZZ_AVAILABLE = True
+except ImportError:
+    RAPIDFUZZ_AVAILABLE = False
+    print("警告：rapidfuzz 套件未安裝，試劑名稱模糊比對將使用較慢的純 Python 模式")
+
+# 嘗試導入 orjson 用於加速 JSON 輸出
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+    print("警告：orjson 套件未安裝，JSON 輸出將使用 Flask 預設模式")
+
+# 嘗試導入 waitress 作為多執行緒 WSGI 伺服器
+try:
+    from waitress import serve as waitress_serve
+    WAITRESS_AVAILABLE = True
+except ImportError:
+    WAITRESS_AVAILABLE = False
+    print("警告：waitress 套件未安裝，將使用 Flask 內建伺服器")
+
 # 嘗試導入Windows列印相關套件
 try:
     import win32print
@@ -29,6 +82,7 @@ except ImportError:
     print("警告：win32print 套件未安裝，Windows列印功能將不可用")
 
 # 取得執行檔所在目錄
+@functools.lru_cache(maxsize=1)
 def get_app_directory():
     """取得應用程式所在目錄"""
     if getattr(sys, 'frozen', False):
@@ -39,12 +93,15 @@ def get_app_directory():
         app_dir = os.path.dirname(os.path.abspath(__file__))
     return app_dir
 
+@functools.lru_cache(maxsize=1)
 def find_sumatra_pdf():
     """
     尋找 SumatraPDF.exe，優先順序：
     1. 應用程式目錄內的 SumatraPDF.exe
     2. PyInstaller 臨時解壓目錄（如果有）
     3. 系統常見安裝路徑
+    
+    結果在程式執行期間不會改變，只搜尋一次
     """
     app_dir = get_app_directory()
     
@@ -76,17 +133,84 @@ def find_sumatra_pdf():
     
     return None
 
+@functools.lru_cache(maxsize=1)
+def find_adobe_reader():
+    """
+    尋找 Adobe Reader（AcroRd32.exe），找不到時返回 None
+    
+    結果在程式執行期間不會改變，只搜尋一次
+    """
+    adobe_path = r"C:\Program Files (x86)\Adobe\Acrobat Reader DC\Reader\AcroRd32.exe"
+    if os.path.exists(adobe_path):
+        return adobe_path
+    return None
+
+def open_with_default_app(file_path):
+    """
+    以系統預設程式開啟檔案（讓用戶手動列印或儲存）
+    
+    os.startfile 直接交給 Windows Shell 開啟，不需另外啟動 cmd.exe 執行 start 指令
+    """
+    try:
+        os.startfile(file_path)
+    except (AttributeError, OSError):
+        # 非 Windows 環境沒有 os.startfile，或 Shell 開啟失敗時改用 start 指令
+        subprocess.Popen(['start', file_path], shell=True)
+
 # 設定資料庫路徑
 APP_DIR = get_app_directory()
 
 # ZPL 圖形模式設定（全域變數）
 ZPL_CHINESE_FONT_PATH = None
 ZPL_CHINESE_FONT_SIZE = 22  # 點數，與 ZPL 字型大小對應
-ZPL_FIXED_GRAPHICS = {}  # 儲存固定文字的預定義圖形
+_ZPL_FONT_REGULAR = None  # 預先載入的字型物件（一般）
+_ZPL_FONT_BOLD = None  # 預先載入的字型物件（粗體，找不到時為 None）
+ZPL_FIXED_GRAPHICS = types.MappingProxyType({})  # 儲存固定文字的預定義圖形（生成後為唯讀）
+_FIXED_GRAPHICS_STR = ""  # 所有固定圖形定義合併後的字串（與 ZPL_FIXED_GRAPHICS 一起生成）
+# 圖形資料預設只使用 ACS 壓縮（所有 ZPL II 韌體都支援）；確認印表機韌體支援 Z64 時，
+# 可設定環境變數 RSTORAGE_ZPL_Z64=1，在 Z64 較短時改用 Z64（韌體不支援時圖形會印成空白）
+ZPL_USE_Z64 = os.environ.get('RSTORAGE_ZPL_Z64', '').strip().lower() in ('1', 'true', 'yes')
+_HEX_TABLE = tuple(f"{i:02X}" for i in range(256))  # 位元組轉 HEX 對照表（兩位數，大寫）
+
+# 同一個列印工作中，每個圖形只在第一次出現時傳送 ~DGR 定義，之後的標籤直接以 ^XG 叫用。
+# 不跨列印工作記錄：印表機重新開機、記憶體清空或工作被取消後，下一個工作仍帶有完整定義
+_ZPL_GRAPHIC_DEF_PATTERN = re.compile(r"^~DGR:([^,]+),[^\n]*\n", re.MULTILINE)  # 整行圖形定義
+
+def _dedupe_graphic_defs(zpl_commands):
+    """移除同一個列印工作中重複的圖形定義行，返回新的標籤指令列表（^XG 叫用保持不變）"""
+    sent_graphics = set()
+    bare_commands = {}  # 已處理過的標籤內容 -> 移除所有圖形定義後的內容
+    
+    def keep_first(match):
+        if match.group(1) in sent_graphics:
+            return ""
+        sent_graphics.add(match.group(1))
+        return match.group(0)
+    
+    result = []
+    for zpl in zpl_commands:
+        bare = bare_commands.get(zpl)
+        if bare is None:
+            # 第一次出現的標籤內容：保留尚未傳送過的定義
+            result.append(_ZPL_GRAPHIC_DEF_PATTERN.sub(keep_first, zpl))
+            bare_commands[zpl] = _ZPL_GRAPHIC_DEF_PATTERN.sub("", zpl)
+        else:
+            # 重複的標籤內容：定義都已在前面傳送過
+            result.append(bare)
+    return result
+
+def _zpl_graphic_id(text):
+    """由文字產生穩定的雜湊，作為動態圖形名稱的一部分
+    
+    內建 hash() 每次啟動結果都不同，改用 blake2s 讓相同文字永遠得到相同名稱。
+    同一個列印工作中同名圖形只定義一次，名稱碰撞會印出別的文字（例如錯誤的批號或效期），
+    因此使用 128 位元的雜湊。
+    """
+    return hashlib.blake2s(text.encode('utf-8'), digest_size=16).hexdigest().upper()
 
 def _load_chinese_font_for_zpl():
-    """載入微軟正黑體供 ZPL 圖形模式使用"""
-    global ZPL_CHINESE_FONT_PATH
+    """載入微軟正黑體供 ZPL 圖形模式使用（字型物件只載入一次，供後續重複使用）"""
+    global ZPL_CHINESE_FONT_PATH, _ZPL_FONT_REGULAR, _ZPL_FONT_BOLD
     if not IMAGE_AVAILABLE:
         return False
     
@@ -100,17 +224,32 @@ def _load_chinese_font_for_zpl():
         for font_path in font_paths:
             if os.path.exists(font_path):
                 try:
-                    # 測試是否可以載入字型
-                    test_font = ImageFont.truetype(font_path, ZPL_CHINESE_FONT_SIZE)
+                    _ZPL_FONT_REGULAR = ImageFont.truetype(font_path, ZPL_CHINESE_FONT_SIZE)
                     ZPL_CHINESE_FONT_PATH = font_path
                     print(f"ZPL 圖形模式使用字型: {font_path} (微軟正黑體)")
-                    return True
+                    break
                 except Exception as e:
                     print(f"無法載入字型 {font_path}: {e}")
                     continue
         
-        print("警告：未找到微軟正黑體字型，ZPL 圖形模式可能無法正確顯示文字")
-        return False
+        if _ZPL_FONT_REGULAR is None:
+            print("警告：未找到微軟正黑體字型，ZPL 圖形模式可能無法正確顯示文字")
+            return False
+        
+        # 載入粗體字型（新批號標記使用），找不到時沿用一般字型
+        bold_font_paths = [
+            "C:/Windows/Fonts/msjhbd.ttc",  # 微軟正黑體粗體
+            "C:/Windows/Fonts/msyhbd.ttc",  # 微軟雅黑粗體（備用）
+        ]
+        for font_path in bold_font_paths:
+            if os.path.exists(font_path):
+                try:
+                    _ZPL_FONT_BOLD = ImageFont.truetype(font_path, ZPL_CHINESE_FONT_SIZE)
+                    break
+                except Exception:
+                    continue
+        
+        return True
                 
     except Exception as e:
         print(f"載入微軟正黑體失敗: {e}")
@@ -127,36 +266,36 @@ def _text_to_zpl_graphic(text, item_name, bold=False):
     Returns:
         ZPL 圖形指令字串（包含 ~DGR 定義），如果失敗則返回 None
     """
+    graphic = _render_text_graphic(text, bold)
+    if graphic is None:
+        return None
+    
+    total_bytes, bytes_per_row, hex_data = graphic
+    # 格式：~DGR:名稱,總位元組數,每行列數,壓縮的HEX資料
+    return f"~DGR:{item_name},{total_bytes:05d},{bytes_per_row:03d},{hex_data}"
+
+@functools.lru_cache(maxsize=4096)
+def _render_text_graphic(text, bold=False):
+    """將文字點陣化並轉為壓縮的 ZPL HEX 資料
+    
+    結果依 (文字, 粗體) 快取，與圖形項目名稱無關：同一批列印或重複列印相同試劑時，
+    不需重新點陣化文字。
+    
+    Returns:
+        (總位元組數, 每行列數, 壓縮的HEX資料)，如果失敗則返回 None
+    """
     if not IMAGE_AVAILABLE or not ZPL_CHINESE_FONT_PATH:
         return None
     
     try:
-        # 載入字型（如果要求粗體，優先使用粗體字型）
-        if bold:
-            # 嘗試載入粗體字型
-            bold_font_paths = [
-                "C:/Windows/Fonts/msjhbd.ttc",  # 微軟正黑體粗體
-                "C:/Windows/Fonts/msyhbd.ttc",  # 微軟雅黑粗體（備用）
-            ]
-            font = None
-            for font_path in bold_font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        font = ImageFont.truetype(font_path, ZPL_CHINESE_FONT_SIZE)
-                        break
-                    except:
-                        continue
-            # 如果粗體字型載入失敗，使用一般字型
-            if font is None:
-                font = ImageFont.truetype(ZPL_CHINESE_FONT_PATH, ZPL_CHINESE_FONT_SIZE)
+        # 使用預先載入的字型（如果要求粗體，優先使用粗體字型）
+        if bold and _ZPL_FONT_BOLD is not None:
+            font = _ZPL_FONT_BOLD
         else:
-            font = ImageFont.truetype(ZPL_CHINESE_FONT_PATH, ZPL_CHINESE_FONT_SIZE)
+            font = _ZPL_FONT_REGULAR
         
-        # 計算文字尺寸
-        # 使用較大的臨時圖片來測量文字大小（包含上升和下降部分）
-        temp_img = Image.new('RGB', (1000, 200), (255, 255, 255))
-        temp_draw = ImageDraw.Draw(temp_img)
-        bbox = temp_draw.textbbox((0, 0), text, font=font)
+        # 計算文字尺寸（包含上升和下降部分），直接由字型測量，不需建立臨時圖片
+        bbox = font.getbbox(text)
         
         # 邊界框：left, top, right, bottom
         # top 可能是負數（上升部分，如大寫字母），bottom 是正數
@@ -195,11 +334,15 @@ def _text_to_zpl_graphic(text, item_name, bold=False):
         bytes_per_row = (img_width + 7) // 8  # 每行需要幾個位元組（8位=1位元組）
         total_bytes = bytes_per_row * img_height
         
-        # 生成 ~DGR 指令
-        # 格式：~DGR:名稱,總位元組數,每行列數,壓縮的HEX資料
-        zpl_command = f"~DGR:{item_name},{total_bytes:05d},{bytes_per_row:03d},{hex_data}"
+        # 使用 ZPL 壓縮格式縮短傳送到印表機的資料量（Z64 與 ACS 取較短者）
+        compressed = _zpl_compress_hex(hex_data, bytes_per_row)
+        if ZPL_USE_Z64:
+            z64_data = _zpl_z64_encode(bytes.fromhex(hex_data))
+            if len(z64_data) < len(compressed):
+                compressed = z64_data
+        hex_data = compressed
         
-        return zpl_command
+        return total_bytes, bytes_per_row, hex_data
         
     except Exception as e:
         print(f"將文字轉換為 ZPL 圖形失敗: {text}, 錯誤: {e}")
@@ -220,6 +363,13 @@ def _image_to_zpl_hex(img):
     - 需要反轉
     """
     try:
+        if NUMPY_AVAILABLE:
+            # 一次轉換整張圖片：反轉後以 packbits 打包（最高位對應最左側像素，
+            # 每行不足 8 像素的部分自動補 0，與 (width + 7) // 8 的行寬一致）
+            arr = 1 - np.asarray(img, dtype=np.uint8)
+            packed = np.packbits(arr, axis=1, bitorder='big')
+            return packed.tobytes().hex().upper()
+        
         width, height = img.size
         bytes_per_row = (width + 7) // 8
         
@@ -245,7 +395,7 @@ def _image_to_zpl_hex(img):
                         # 如果 pixel_value == 1（PIL 白色），ZPL 設為 0（白色），不需要操作
                 
                 # 轉換為 HEX（兩位數，大寫）
-                hex_chars.append(f"{byte_value:02X}")
+                hex_chars.append(_HEX_TABLE[byte_value])
         
         # 合併所有 HEX 字元
         hex_string = ''.join(hex_chars)
@@ -258,9 +408,77 @@ def _image_to_zpl_hex(img):
         traceback.print_exc()
         return None
 
+def _zpl_repeat_prefix(count):
+    """將重複次數轉換為 ZPL 壓縮計數字元
+    
+    - G~Y 代表 1~19 次
+    - g~z 代表 20, 40, ..., 400 次
+    - 多個計數字元相加，例如 hB = 40 + 2 = 42 次
+    """
+    prefix = []
+    while count >= 400:
+        prefix.append('z')
+        count -= 400
+    if count >= 20:
+        prefix.append(chr(ord('g') + count // 20 - 1))
+        count %= 20
+    if count:
+        prefix.append(chr(ord('G') + count - 1))
+    return ''.join(prefix)
+
+def _zpl_compress_hex(hex_data, bytes_per_row):
+    """將 ZPL HEX 圖形資料轉換為 ZPL 壓縮格式（Zebra ACS 壓縮）
+    
+    壓縮規則：
+    - 連續相同的 HEX 字元以「計數字元 + HEX 字元」表示
+    - 行尾剩餘全為 0 以 , 表示；全為 F 以 ! 表示
+    - 與上一行完全相同的行以 : 表示
+    """
+    row_length = bytes_per_row * 2
+    compressed_rows = []
+    previous_row = None
+    
+    for start in range(0, len(hex_data), row_length):
+        row = hex_data[start:start + row_length]
+        
+        if row == previous_row:
+            compressed_rows.append(':')
+            continue
+        previous_row = row
+        
+        # 行尾填滿 0 或 F 的部分用單一字元表示
+        if row.endswith('0'):
+            row, row_end = row.rstrip('0'), ','
+        elif row.endswith('F'):
+            row, row_end = row.rstrip('F'), '!'
+        else:
+            row_end = ''
+        
+        parts = []
+        for char, group in itertools.groupby(row):
+            count = len(list(group))
+            if count > 1:
+                parts.append(_zpl_repeat_prefix(count))
+            parts.append(char)
+        parts.append(row_end)
+        compressed_rows.append(''.join(parts))
+    
+    return ''.join(compressed_rows)
+
+def _zpl_z64_encode(raw_data):
+    """將圖形資料轉換為 ZPL Z64 格式
+    
+    格式為 :Z64:<Base64 編碼的 zlib 壓縮資料>:<CRC>，
+    CRC 為 Base64 字串的 CRC-16（CCITT），以四位大寫 HEX 表示
+    """
+    encoded = base64.b64encode(zlib.compress(raw_data, 9))
+    return f":Z64:{encoded.decode('ascii')}:{binascii.crc_hqx(encoded, 0):04X}"
+
 def _generate_fixed_graphics():
-    """生成固定文字的預定義圖形（使用微軟正黑體）"""
-    global ZPL_FIXED_GRAPHICS
+    """生成固定文字的預定義圖形（使用微軟正黑體），只在啟動時生成一次"""
+    global ZPL_FIXED_GRAPHICS, _FIXED_GRAPHICS_STR
+    if ZPL_FIXED_GRAPHICS:
+        return
     if not IMAGE_AVAILABLE or not ZPL_CHINESE_FONT_PATH:
         print("警告：無法生成固定圖形：缺少 PIL 或微軟正黑體字型")
         return
@@ -280,13 +498,18 @@ def _generate_fixed_graphics():
             "QUALIFIED": "(允收合格)"
         }
         
+        fixed_graphics = {}
         for key, text in fixed_texts.items():
             # 新批號標記使用粗體
             is_bold = (key == "NEW_BATCH")
             zpl_graphic = _text_to_zpl_graphic(text, f"ITEM_{key}", bold=is_bold)
             if zpl_graphic:
-                ZPL_FIXED_GRAPHICS[key] = zpl_graphic
+                fixed_graphics[key] = zpl_graphic
         
+        # 凍結為唯讀對照表，避免列印流程中被修改或重新生成
+        ZPL_FIXED_GRAPHICS = types.MappingProxyType(fixed_graphics)
+        # 每張標籤都會用到全部固定圖形定義，先合併成一個字串
+        _FIXED_GRAPHICS_STR = "".join(graphic_def + "\n" for graphic_def in fixed_graphics.values())
         print(f"成功生成 {len(ZPL_FIXED_GRAPHICS)} 個固定圖形")
         
     except Exception as e:
@@ -332,6 +555,206 @@ class ReagentEntry(db.Model):
     unit = db.Column(db.String(20), nullable=False)
     supplier = db.Column(db.String(100), nullable=False)
     entry_date = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        # 依試劑名稱（及批號）查詢：建議、供應商、新批號檢查；
+        # 加上入庫日期（遞減）後，批號效期查詢可直接取索引第一筆，不需另外排序
+        db.Index('ix_expiry_lookup', reagent_name, reagent_batch_number, entry_date.desc()),
+        # 依入庫日期排序：最近記錄列表
+        db.Index('ix_entry_date', 'entry_date'),
+    )
+
+def _configure_sqlite_connection(dbapi_connection, connection_record):
+    """設定 SQLite 連線參數（WAL 模式讓讀寫可同時進行，並減少每次提交的磁碟同步）"""
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA cache_size=-20000")  # 約 20MB 快取
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA mmap_size=268435456")  # 最多 256MB 以記憶體映射讀取，減少讀取時的系統呼叫與複製
+    cursor.close()
+
+# 建立資料庫（只在啟動時執行一次）
+with app.app_context():
+    event.listen(db.engine, 'connect', _configure_sqlite_connection)
+    db.create_all()
+    # 既有資料庫不會由 create_all 補建索引，需個別建立
+    for index in ReagentEntry.__table__.indexes:
+        index.create(db.engine, checkfirst=True)
+
+# 試劑名稱建議快取（輸入時每個按鍵都會查詢，重複的查詢直接使用快取結果）
+SUGGESTION_CACHE_SIZE = 512
+SUGGESTION_CACHE_TTL = 60  # 秒
+_suggestion_cache = OrderedDict()  # 查詢字串 -> (建立時間, 建議列表)
+_suggestion_cache_lock = threading.Lock()
+
+def _get_cached_suggestions(key):
+    """取得快取的試劑名稱建議，沒有或已過期時返回 None"""
+    with _suggestion_cache_lock:
+        cached = _suggestion_cache.get(key)
+        if cached is None:
+            return None
+        created_at, suggestions = cached
+        if time.monotonic() - created_at > SUGGESTION_CACHE_TTL:
+            del _suggestion_cache[key]
+            return None
+        _suggestion_cache.move_to_end(key)
+        return suggestions
+
+def _cache_suggestions(key, suggestions, data_version):
+    """儲存試劑名稱建議到快取（超過上限時移除最久未使用的項目）
+    
+    data_version 為開始計算前的資料版本；計算期間資料已變更（快取已被清除）時不儲存，
+    避免把舊結果存在新版本底下
+    """
+    with _suggestion_cache_lock:
+        if data_version != _data_version:
+            return
+        _suggestion_cache[key] = (time.monotonic(), suggestions)
+        _suggestion_cache.move_to_end(key)
+        while len(_suggestion_cache) > SUGGESTION_CACHE_SIZE:
+            _suggestion_cache.popitem(last=False)
+
+# 資料庫中所有不重複的試劑名稱（建議查詢直接在記憶體中比對，資料變更時重新載入）
+_reagent_names = None
+_reagent_names_lock = threading.Lock()
+
+def _get_reagent_names():
+    """取得所有不重複的試劑名稱（第一次使用時才從資料庫載入）
+    
+    返回 (名稱, 大寫名稱) 兩個對應的 tuple，依大寫名稱排序，可用 bisect 找出開頭匹配的名稱
+    """
+    global _reagent_names
+    with _reagent_names_lock:
+        if _reagent_names is None:
+            names = sorted(db.session.execute(
+                db.select(ReagentEntry.reagent_name).distinct()
+            ).scalars(), key=str.upper)
+            _reagent_names = (tuple(names), tuple(name.upper() for name in names))
+        return _reagent_names
+
+# 依試劑名稱查詢的常用供應商/單位與歷史批號快取（選擇試劑時會重複查詢）
+REAGENT_LOOKUP_CACHE_SIZE = 512
+_reagent_lookup_cache = OrderedDict()  # (查詢類型, 試劑名稱) -> 回應資料
+_reagent_lookup_cache_lock = threading.Lock()
+
+def _get_cached_reagent_lookup(key):
+    """取得快取的試劑查詢結果，沒有時返回 None"""
+    with _reagent_lookup_cache_lock:
+        cached = _reagent_lookup_cache.get(key)
+        if cached is not None:
+            _reagent_lookup_cache.move_to_end(key)
+        return cached
+
+def _cache_reagent_lookup(key, result, data_version):
+    """儲存試劑查詢結果到快取（超過上限時移除最久未使用的項目）
+    
+    查詢期間資料已變更時不儲存（同 _cache_suggestions）
+    """
+    with _reagent_lookup_cache_lock:
+        if data_version != _data_version:
+            return
+        _reagent_lookup_cache[key] = result
+        _reagent_lookup_cache.move_to_end(key)
+        while len(_reagent_lookup_cache) > REAGENT_LOOKUP_CACHE_SIZE:
+            _reagent_lookup_cache.popitem(last=False)
+
+# 各（試劑名稱, 批號）最早入庫記錄的 ID（列印時用來判斷是否為新批號）
+EARLIEST_ENTRY_CACHE_SIZE = 1024
+_earliest_entry_cache = OrderedDict()  # (試劑名稱, 批號) -> 最早入庫記錄 ID
+_earliest_entry_cache_lock = threading.Lock()
+
+def _get_earliest_entry_id(reagent_name, batch_number):
+    """取得該試劑批號最早入庫記錄的 ID（結果會快取，資料變更時清除）"""
+    key = (reagent_name, batch_number)
+    with _earliest_entry_cache_lock:
+        if key in _earliest_entry_cache:
+            _earliest_entry_cache.move_to_end(key)
+            return _earliest_entry_cache[key]
+    
+    data_version = _data_version
+    earliest_id = db.session.execute(lambda_stmt(
+        lambda: db.select(ReagentEntry.id).where(
+            ReagentEntry.reagent_name == reagent_name,
+            ReagentEntry.reagent_batch_number == batch_number
+        ).order_by(ReagentEntry.entry_date.asc()).limit(1)
+    )).scalar()
+    
+    # 查詢期間資料已變更（例如 CSV 匯入改寫入庫日期）時不儲存，避免存入舊結果
+    with _earliest_entry_cache_lock:
+        if data_version != _data_version:
+            return earliest_id
+        _earliest_entry_cache[key] = earliest_id
+        while len(_earliest_entry_cache) > EARLIEST_ENTRY_CACHE_SIZE:
+            _earliest_entry_cache.popitem(last=False)
+    return earliest_id
+
+# 入庫資料版本（每次資料變更時遞增），作為記錄列表與名稱建議的 HTTP ETag
+# 前綴每次啟動都不同，避免重新啟動後瀏覽器沿用舊的 ETag
+_DATA_ETAG_PREFIX = f"{os.getpid():x}{int(time.time()):x}"
+_data_version = 0
+
+def _data_etag():
+    """取得目前資料版本的 ETag"""
+    return f"{_DATA_ETAG_PREFIX}-{_data_version}"
+
+def _with_etag(response, etag):
+    """設定 ETag，並要求瀏覽器每次使用快取前先向伺服器確認"""
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    return response
+
+def _not_modified(etag):
+    """資料未變更時返回 304（不需查詢資料庫與序列化 JSON）"""
+    return _with_etag(app.response_class(status=304), etag)
+
+def _clear_reagent_caches():
+    """入庫資料變更後清除試劑相關的快取
+    
+    先遞增資料版本再清除快取：儲存快取時會在快取鎖內比對版本，
+    清除前就已開始計算的舊結果不會再被存入
+    """
+    global _reagent_names, _data_version
+    with _reagent_names_lock:
+        _reagent_names = None
+        _data_version += 1
+    with _suggestion_cache_lock:
+        _suggestion_cache.clear()
+    with _reagent_lookup_cache_lock:
+        _reagent_lookup_cache.clear()
+    with _earliest_entry_cache_lock:
+        _earliest_entry_cache.clear()
+
+# 入庫記錄列表使用的欄位（直接查詢欄位值，不建立 ORM 物件）
+ENTRY_LIST_COLUMNS = (
+    ReagentEntry.id,
+    ReagentEntry.reagent_name,
+    ReagentEntry.reagent_batch_number,
+    ReagentEntry.expiry_date,
+    ReagentEntry.quantity,
+    ReagentEntry.unit,
+    ReagentEntry.supplier,
+    ReagentEntry.entry_date,
+)
+
+def _json_response(data):
+    """輸出 JSON 回應（列表與高頻查詢使用 orjson 序列化，未安裝時使用 jsonify）"""
+    if not ORJSON_AVAILABLE:
+        return jsonify(data)
+    return app.response_class(orjson.dumps(data), mimetype='application/json')
+
+def _entry_row_to_dict(row):
+    """將入庫記錄查詢結果轉換為 JSON 格式"""
+    return {
+        'id': row.id,
+        'reagent_name': row.reagent_name,
+        'reagent_batch_number': row.reagent_batch_number,
+        'expiry_date': row.expiry_date.isoformat(),  # YYYY-MM-DD
+        'quantity': row.quantity,
+        'unit': row.unit,
+        'supplier': row.supplier,
+        'entry_date': row.entry_date.isoformat(sep=' ', timespec='seconds')  # YYYY-MM-DD HH:MM:SS
+    }
 
 @app.route('/')
 def index():
@@ -342,7 +765,7 @@ def get_suppliers():
     """獲取所有供應商列表"""
     try:
         suppliers = Supplier.query.order_by(Supplier.name).all()
-        return jsonify([{'id': s.id, 'name': s.name} for s in suppliers])
+        return _json_response([{'id': s.id, 'name': s.name} for s in suppliers])
     except Exception as e:
         print(f"獲取供應商列表失敗: {e}")
         return jsonify({'error': str(e)}), 500
@@ -372,36 +795,29 @@ def add_supplier():
 @app.route('/api/entries', methods=['GET'])
 def get_entries():
     try:
-        # 先建立資料庫
-        with app.app_context():
-            db.create_all()
+        etag = _data_etag()
+        if etag in request.if_none_match:
+            return _not_modified(etag)
         
         # 查詢記錄（限制只返回最近50筆）
-        entries = ReagentEntry.query.order_by(ReagentEntry.entry_date.desc()).limit(50).all()
+        entries = db.session.execute(
+            db.select(*ENTRY_LIST_COLUMNS).order_by(ReagentEntry.entry_date.desc()).limit(50)
+        ).all()
         print(f"找到 {len(entries)} 筆記錄（最近50筆）")
         
         # 獲取總記錄數（用於前端顯示）
-        total_count = ReagentEntry.query.count()
+        total_count = db.session.execute(
+            db.select(db.func.count()).select_from(ReagentEntry)
+        ).scalar()
         
-        result = []
-        for entry in entries:
-            result.append({
-                'id': entry.id,
-                'reagent_name': entry.reagent_name,
-                'reagent_batch_number': entry.reagent_batch_number,
-                'expiry_date': entry.expiry_date.strftime('%Y-%m-%d'),
-                'quantity': entry.quantity,
-                'unit': entry.unit,
-                'supplier': entry.supplier,
-                'entry_date': entry.entry_date.strftime('%Y-%m-%d %H:%M:%S')
-            })
+        result = [_entry_row_to_dict(row) for row in entries]
         
         print(f"返回 {len(result)} 筆記錄，資料庫共有 {total_count} 筆")
-        return jsonify({
+        return _with_etag(_json_response({
             'entries': result,
             'totalCount': total_count,
             'limitApplied': len(entries) < total_count
-        })
+        }), etag)
         
     except Exception as e:
         print(f"錯誤: {e}")
@@ -409,23 +825,31 @@ def get_entries():
         traceback.print_exc()
         return jsonify({'error': str(e)}), 500
 
+def _parse_expiry_date(text):
+    """解析 YYYY-MM-DD 格式的穩定效期（fromisoformat 失敗時改用 strptime，可接受未補零的月、日）"""
+    try:
+        return date.fromisoformat(text)
+    except ValueError:
+        return datetime.strptime(text, '%Y-%m-%d').date()
+
 @app.route('/api/entries', methods=['POST'])
 def add_entry():
     try:
         data = request.json
         print(f"收到新增請求: {data}")
         
-        # 建立資料庫
-        with app.app_context():
-            db.create_all()
+        # 檢查是否為新批號（只需確認是否存在，不需要載入整筆記錄）
+        # 使用 lambda_stmt 快取編譯後的 SQL，閉包變數會自動轉為綁定參數
+        reagent_name = data['reagent_name']
+        batch_number = data['reagent_batch_number']
+        batch_exists = db.session.execute(lambda_stmt(
+            lambda: db.select(db.exists().where(
+                ReagentEntry.reagent_name == reagent_name,
+                ReagentEntry.reagent_batch_number == batch_number
+            ))
+        )).scalar()
         
-        # 檢查是否為新批號
-        existing_entry = ReagentEntry.query.filter_by(
-            reagent_name=data['reagent_name'],
-            reagent_batch_number=data['reagent_batch_number']
-        ).first()
-        
-        is_new_batch = existing_entry is None
+        is_new_batch = not batch_exists
         
         if is_new_batch:
             print(f"檢測到新批號: {data['reagent_name']} - {data['reagent_batch_number']}")
@@ -440,7 +864,7 @@ def add_entry():
         entry = ReagentEntry(
             reagent_name=data['reagent_name'],
             reagent_batch_number=data['reagent_batch_number'],
-            expiry_date=datetime.strptime(data['expiry_date'], '%Y-%m-%d').date(),
+            expiry_date=_parse_expiry_date(data['expiry_date']),  # YYYY-MM-DD
             quantity=data['quantity'],
             unit=data['unit'],
             supplier=data['supplier']
@@ -448,6 +872,7 @@ def add_entry():
         
         db.session.add(entry)
         db.session.commit()
+        _clear_reagent_caches()
         
         print(f"成功新增記錄: {entry.id}")
         
@@ -472,14 +897,10 @@ def confirm_entry():
         data = request.json
         print(f"確認入庫請求: {data}")
         
-        # 建立資料庫
-        with app.app_context():
-            db.create_all()
-        
         entry = ReagentEntry(
             reagent_name=data['reagent_name'],
             reagent_batch_number=data['reagent_batch_number'],
-            expiry_date=datetime.strptime(data['expiry_date'], '%Y-%m-%d').date(),
+            expiry_date=_parse_expiry_date(data['expiry_date']),  # YYYY-MM-DD
             quantity=data['quantity'],
             unit=data['unit'],
             supplier=data['supplier']
@@ -487,6 +908,7 @@ def confirm_entry():
         
         db.session.add(entry)
         db.session.commit()
+        _clear_reagent_caches()
         
         print(f"成功新增新批號記錄: {entry.id}")
         
@@ -512,38 +934,29 @@ def search_entries():
         if not query:
             return jsonify({'entries': [], 'totalCount': 0, 'isSearchResult': True})
         
+        stmt = db.select(*ENTRY_LIST_COLUMNS).order_by(ReagentEntry.entry_date.desc())
+        
         # 處理特殊查詢「all_records」- 用於日期篩選
         if query == 'all_records':
             print("執行全部記錄查詢（用於日期篩選）")
-            entries = ReagentEntry.query.order_by(ReagentEntry.entry_date.desc()).all()
         else:
             # 一般搜尋 - 不限制筆數，可以找到所有符合條件的記錄
-            entries = ReagentEntry.query.filter(
+            stmt = stmt.where(
                 db.or_(
                     ReagentEntry.reagent_name.contains(query),
                     ReagentEntry.reagent_batch_number.contains(query),
                     ReagentEntry.supplier.contains(query)
                 )
-            ).order_by(ReagentEntry.entry_date.desc()).all()
+            )
+        entries = db.session.execute(stmt).all()
         
         # 計算總記錄數
         total_count = len(entries)
         print(f"搜尋 '{query}' 找到 {total_count} 筆記錄")
         
-        result = []
-        for entry in entries:
-            result.append({
-                'id': entry.id,
-                'reagent_name': entry.reagent_name,
-                'reagent_batch_number': entry.reagent_batch_number,
-                'expiry_date': entry.expiry_date.strftime('%Y-%m-%d'),
-                'quantity': entry.quantity,
-                'unit': entry.unit,
-                'supplier': entry.supplier,
-                'entry_date': entry.entry_date.strftime('%Y-%m-%d %H:%M:%S')
-            })
+        result = [_entry_row_to_dict(row) for row in entries]
         
-        return jsonify({
+        return _json_response({
             'entries': result,
             'totalCount': total_count,
             'isSearchResult': True
@@ -560,17 +973,65 @@ def reprint_labels(entry_id):
         data = request.json
         quantity = data.get('quantity', entry.quantity)
         
-        labels_printed = generate_and_print_labels(entry, quantity)
+        job_id = next(_print_job_ids)
+        print(f"補印標籤請求: 記錄ID {entry_id}, 數量 {quantity}, 列印工作 {job_id}")
+        
+        # 加入列印佇列，由背景執行緒列印
+        if not _enqueue_print_job({
+            'job_id': job_id,
+            'entry_id': entry.id,
+            'quantity': quantity,
+            'is_new_batch': False,
+            'printer_type': 'zpl'
+        }):
+            return jsonify({
+                'success': False,
+                'message': '列印佇列已滿，請稍後再試'
+            }), 429
         
         return jsonify({
             'success': True,
-            'message': f'已重新列印 {labels_printed} 張標籤'
-        })
+            'queued': True,
+            'job_id': job_id,
+            'message': f'已加入列印佇列：重新列印 {quantity} 張標籤'
+        }), 202
         
     except Exception as e:
         print(f"補印標籤失敗: {e}")
         return jsonify({'error': str(e)}), 500
 
+# CSV 日期格式：ISO 格式 YYYY-MM-DD / YYYY-MM-DD HH:MM:SS，以及備用的 YYYY/MM/DD
+CSV_DATE_FORMAT = '%Y-%m-%d'
+CSV_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+CSV_FALLBACK_DATE_FORMAT = '%Y/%m/%d'
+
+def _parse_csv_dates(expiry_text, entry_text):
+    """解析 CSV 的穩定效期和入庫日期，返回 (穩定效期, 入庫日期)
+    
+    先以 fromisoformat 快速解析標準 ISO 格式；失敗時改用 strptime 的 YYYY-MM-DD /
+    YYYY-MM-DD HH:MM:SS（可接受未補零的月、日、時），再失敗時兩個欄位都改用
+    YYYY/MM/DD 格式，格式錯誤時拋出 ValueError
+    """
+    try:
+        expiry_date = date.fromisoformat(expiry_text)
+        entry_date = datetime.fromisoformat(entry_text)
+        # 帶時區的時間無法與其他記錄比較，交由下方格式處理（會視為格式錯誤）
+        if entry_date.tzinfo is None:
+            return expiry_date, entry_date
+    except ValueError:
+        pass
+    
+    try:
+        return (
+            datetime.strptime(expiry_text, CSV_DATE_FORMAT).date(),
+            datetime.strptime(entry_text, CSV_DATETIME_FORMAT)
+        )
+    except ValueError:
+        return (
+            datetime.strptime(expiry_text, CSV_FALLBACK_DATE_FORMAT).date(),
+            datetime.strptime(entry_text, CSV_FALLBACK_DATE_FORMAT)
+        )
+
 @app.route('/api/import-csv', methods=['POST'])
 def import_csv():
     """匯入CSV檔案到資料庫"""
@@ -590,20 +1051,14 @@ def import_csv():
             return jsonify({'error': '請選擇CSV檔案'}), 400
         
         # 讀取CSV內容
-        import csv
-        import io
-        
-        # 設定UTF-8編碼
-        content = file.read().decode('utf-8-sig')  # 處理BOM
-        csv_reader = csv.DictReader(io.StringIO(content))
-        
-        # 建立資料庫
-        with app.app_context():
-            db.create_all()
+        # 設定UTF-8編碼，逐行讀取上傳的檔案（不一次載入整個檔案）
+        csv_stream = io.TextIOWrapper(file.stream, encoding='utf-8-sig', newline='')  # 處理BOM
+        csv_reader = csv.DictReader(csv_stream)
         
         success_count = 0
         error_count = 0
         errors = []
+        parsed_rows = []  # 驗證通過的資料
         
         # 處理每一行資料
         for row_num, row in enumerate(csv_reader, start=2):  # 從第2行開始（第1行是標題）
@@ -616,15 +1071,9 @@ def import_csv():
                 
                 # 解析日期
                 try:
-                    expiry_date = datetime.strptime(row['穩定效期'].strip(), '%Y-%m-%d').date()
-                    entry_date = datetime.strptime(row['入庫日期'].strip(), '%Y-%m-%d %H:%M:%S')
+                    expiry_date, entry_date = _parse_csv_dates(row['穩定效期'].strip(), row['入庫日期'].strip())
                 except ValueError:
-                    # 嘗試其他日期格式
-                    try:
-                        expiry_date = datetime.strptime(row['穩定效期'].strip(), '%Y/%m/%d').date()
-                        entry_date = datetime.strptime(row['入庫日期'].strip(), '%Y/%m/%d').replace(hour=0, minute=0, second=0)
-                    except ValueError:
-                        raise ValueError(f'日期格式錯誤: 穩定效期="{row["穩定效期"]}", 入庫日期="{row["入庫日期"]}"')
+                    raise ValueError(f'日期格式錯誤: 穩定效期="{row["穩定效期"]}", 入庫日期="{row["入庫日期"]}"')
                 
                 # 解析數量
                 try:
@@ -634,43 +1083,63 @@ def import_csv():
                 except ValueError:
                     raise ValueError(f'數量格式錯誤: "{row["數量"]}"')
                 
-                # 檢查是否已存在相同名稱和批號的記錄
-                existing_entry = ReagentEntry.query.filter_by(
-                    reagent_name=row['試劑名稱'].strip(),
-                    reagent_batch_number=row['試劑批號'].strip()
-                ).first()
-                
-                if existing_entry:
-                    # 更新現有記錄
-                    existing_entry.expiry_date = expiry_date
-                    existing_entry.quantity = quantity
-                    existing_entry.unit = row['單位'].strip()
-                    existing_entry.supplier = row['供應商'].strip()
-                    existing_entry.entry_date = entry_date
-                    db.session.commit()
-                    success_count += 1
-                else:
-                    # 新增新記錄
-                    new_entry = ReagentEntry(
-                        reagent_name=row['試劑名稱'].strip(),
-                        reagent_batch_number=row['試劑批號'].strip(),
-                        expiry_date=expiry_date,
-                        quantity=quantity,
-                        unit=row['單位'].strip(),
-                        supplier=row['供應商'].strip(),
-                        entry_date=entry_date
-                    )
-                    db.session.add(new_entry)
-                    db.session.commit()
-                    success_count += 1
+                parsed_rows.append({
+                    'reagent_name': row['試劑名稱'].strip(),
+                    'reagent_batch_number': row['試劑批號'].strip(),
+                    'expiry_date': expiry_date,
+                    'quantity': quantity,
+                    'unit': row['單位'].strip(),
+                    'supplier': row['供應商'].strip(),
+                    'entry_date': entry_date
+                })
+                success_count += 1
                 
             except Exception as e:
                 error_count += 1
                 errors.append(f'第{row_num}行: {str(e)}')
                 # 繼續處理下一行，不中斷整個匯入過程
         
+        # 一次查詢所有相關的既有記錄，避免逐行查詢資料庫
+        existing_ids = {}  # (試劑名稱, 批號) -> 記錄 ID
+        reagent_names = {record['reagent_name'] for record in parsed_rows}
+        if reagent_names:
+            existing_rows = db.session.query(
+                ReagentEntry.id,
+                ReagentEntry.reagent_name,
+                ReagentEntry.reagent_batch_number
+            ).filter(
+                ReagentEntry.reagent_name.in_(reagent_names)
+            ).order_by(ReagentEntry.id).all()
+            for entry_id, name, batch_number in existing_rows:
+                existing_ids.setdefault((name, batch_number), entry_id)
+        
+        # 區分新增與更新（同一檔案內重複的名稱和批號，以最後一行為準）
+        to_insert = {}  # (試劑名稱, 批號) -> 新記錄
+        to_update = {}  # 記錄 ID -> 更新內容
+        for record in parsed_rows:
+            key = (record['reagent_name'], record['reagent_batch_number'])
+            entry_id = existing_ids.get(key)
+            if entry_id is not None:
+                # 更新現有記錄
+                to_update[entry_id] = {
+                    'id': entry_id,
+                    'expiry_date': record['expiry_date'],
+                    'quantity': record['quantity'],
+                    'unit': record['unit'],
+                    'supplier': record['supplier'],
+                    'entry_date': record['entry_date']
+                }
+            else:
+                # 新增新記錄
+                to_insert[key] = record
+        
+        # 批次寫入
+        db.session.bulk_insert_mappings(ReagentEntry, list(to_insert.values()))
+        db.session.bulk_update_mappings(ReagentEntry, list(to_update.values()))
+        
         # 提交所有變更
         db.session.commit()
+        _clear_reagent_caches()
         
         return jsonify({
             'success': True,
@@ -681,11 +1150,55 @@ def import_csv():
         })
         
     except Exception as e:
+        # 批次寫入失敗時整批復原，避免留下部分匯入的資料
+        db.session.rollback()
         print(f"匯入CSV失敗: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'error': f'匯入失敗: {str(e)}'}), 500
 
+def _ordered_match_count(query_upper, name_upper):
+    """計算查詢字符依序出現在名稱中的數量（逐字向後尋找）"""
+    matched_chars = 0
+    name_index = 0
+    
+    for query_char in query_upper:
+        for i in range(name_index, len(name_upper)):
+            if name_upper[i] == query_char:
+                matched_chars += 1
+                name_index = i + 1
+                break
+    return matched_chars
+
+def _fuzzy_match_reagent_names(query_upper, names):
+    """模糊比對（字符順序匹配）
+    
+    檢查查詢字符是否按順序出現在名稱中，返回至少匹配 70% 字符的
+    [(名稱, 匹配字符數), ...]
+    """
+    min_matched = math.ceil(len(query_upper) * 0.7)
+    
+    if RAPIDFUZZ_AVAILABLE:
+        # 最長共同子序列長度一定不小於逐字比對的匹配數，先以 C 實作篩掉
+        # 不可能達標的名稱，剩下的再用逐字比對計分（維持原順序），結果與純 Python 模式相同
+        results = fuzzy_process.extract(
+            query_upper,
+            [name.upper() for name in names],
+            scorer=LCSseq.similarity,
+            score_cutoff=min_matched,
+            limit=None
+        )
+        candidates = [names[index] for index in sorted(index for _, _, index in results)]
+    else:
+        candidates = names
+    
+    matches = []
+    for name in candidates:
+        matched_chars = _ordered_match_count(query_upper, name.upper())
+        if matched_chars >= min_matched:
+            matches.append((name, matched_chars))
+    return matches
+
 @app.route('/api/reagent-suggestions', methods=['GET'])
 def get_reagent_suggestions():
     """獲取試劑名稱建議（僅從資料庫現有資料）"""
@@ -695,20 +1208,42 @@ def get_reagent_suggestions():
         if not query or len(query) < 1:
             return jsonify([])
         
-        # 獲取所有不重複的試劑名稱
-        all_names = db.session.query(ReagentEntry.reagent_name).distinct().all()
-        all_names = [name[0] for name in all_names]
+        etag = _data_etag()
+        if etag in request.if_none_match:
+            return _not_modified(etag)
         
-        suggestions = []
         query_upper = query.upper()
+        data_version = _data_version
+        cached = _get_cached_suggestions(query_upper)
+        if cached is not None:
+            return _with_etag(_json_response(cached), etag)
         
-        for name in all_names:
-            name_upper = name.upper()
+        all_names, all_names_upper = _get_reagent_names()
+        suggestions = []
+        # 模糊匹配可能的最高分（700 - 名稱長度 + 每個匹配字符 10 分）
+        max_fuzzy_score = 700 + 10 * len(query_upper)
+        
+        # 開頭匹配的名稱在排序後的大寫名稱中是連續的一段，以二分搜尋找出
+        prefix_start = bisect.bisect_left(all_names_upper, query_upper)
+        prefix_end = prefix_start
+        while prefix_end < len(all_names_upper) and all_names_upper[prefix_end].startswith(query_upper):
+            prefix_end += 1
+        
+        # 開頭匹配的分數隨名稱長度遞減，模糊匹配的分數則隨查詢長度增加，兩者可能交錯；
+        # 開頭匹配已有 8 個以上，且第 8 名分數（以第 8 短的名稱估算的下限）仍高於包含匹配
+        # （位置至少 1、名稱至少 1 字，最高 789 分）與模糊匹配可能的最高分時，結果不會改變，只需比對這一段
+        candidates = range(len(all_names))
+        if prefix_end - prefix_start >= 8:
+            eighth_shortest = sorted(len(all_names[index]) for index in range(prefix_start, prefix_end))[7]
+            min_prefix_score = 900 - eighth_shortest + (10 if len(query) > 1 else 0)
+            if min_prefix_score > max(789, max_fuzzy_score):
+                candidates = range(prefix_start, prefix_end)
+        
+        for index in candidates:
+            name = all_names[index]
+            name_upper = all_names_upper[index]
             
             # 計算匹配分數
-            score = 0
-            match_type = ''
-            
             # 1. 完全匹配 (最高分)
             if name_upper == query_upper:
                 score = 1000
@@ -724,39 +1259,45 @@ def get_reagent_suggestions():
                 position = name_upper.find(query_upper)
                 score = 800 - (position * 10) - len(name)
                 match_type = 'contains'
-            # 4. 模糊匹配（字符順序匹配）
             else:
-                # 檢查查詢字符是否按順序出現在名稱中
-                query_chars = list(query_upper)
-                name_chars = list(name_upper)
-                
-                matched_chars = 0
-                name_index = 0
-                
-                for query_char in query_chars:
-                    for i in range(name_index, len(name_chars)):
-                        if name_chars[i] == query_char:
-                            matched_chars += 1
-                            name_index = i + 1
-                            break
-                
-                # 如果至少匹配了70%的字符
-                if matched_chars >= len(query_chars) * 0.7:
-                    score = 700 - len(name) + (matched_chars * 10)
-                    match_type = 'fuzzy'
+                continue
             
-            if score > 0:
-                suggestions.append({
-                    'name': name,
-                    'score': score,
-                    'match_type': match_type
-                })
+            # 包含位置太後面時分數可能不是正數，這類名稱不列入建議
+            if score <= 0:
+                continue
+            
+            suggestions.append({
+                'name': name,
+                'score': score,
+                'match_type': match_type
+            })
         
-        # 按分數排序，取前8個
+        # 按分數排序
         suggestions.sort(key=lambda x: x['score'], reverse=True)
-        suggestions = suggestions[:8]
         
-        return jsonify([item['name'] for item in suggestions])
+        # 4. 模糊匹配：包含匹配的分數會隨位置遞減，可能低於模糊匹配；
+        # 只有前三種匹配已有 8 個且第 8 名分數不低於模糊匹配可能的最高分時，結果才不受影響，可以略過
+        if len(suggestions) < 8 or suggestions[7]['score'] < max_fuzzy_score:
+            # 名稱包含查詢字串時已歸類為前三種匹配，不再做模糊比對
+            other_names = [
+                name for name, name_upper in zip(all_names, all_names_upper)
+                if query_upper not in name_upper
+            ]
+            for name, matched_chars in _fuzzy_match_reagent_names(query_upper, other_names):
+                score = 700 - len(name) + (matched_chars * 10)
+                if score > 0:
+                    suggestions.append({
+                        'name': name,
+                        'score': score,
+                        'match_type': 'fuzzy'
+                    })
+            suggestions.sort(key=lambda x: x['score'], reverse=True)
+        
+        # 取前8個
+        suggestions = [item['name'] for item in suggestions[:8]]
+        _cache_suggestions(query_upper, suggestions, data_version)
+        
+        return _with_etag(_json_response(suggestions), etag)
         
     except Exception as e:
         print(f"獲取建議失敗: {e}")
@@ -771,42 +1312,48 @@ def get_reagent_supplier():
         if not reagent_name:
             return jsonify({'found': False})
         
-        # 查詢該試劑名稱最常用的供應商
-        supplier_query = db.session.query(
-            ReagentEntry.supplier,
-            db.func.count(ReagentEntry.supplier).label('supplier_count')
-        ).filter_by(
-            reagent_name=reagent_name
-        ).group_by(
-            ReagentEntry.supplier
-        ).order_by(
-            db.func.count(ReagentEntry.supplier).desc()
-        ).first()
-        
-        # 查詢該試劑名稱最常用的單位
-        unit_query = db.session.query(
-            ReagentEntry.unit,
-            db.func.count(ReagentEntry.unit).label('unit_count')
-        ).filter_by(
-            reagent_name=reagent_name
-        ).group_by(
-            ReagentEntry.unit
-        ).order_by(
-            db.func.count(ReagentEntry.unit).desc()
-        ).first()
-        
-        if not supplier_query and not unit_query:
+        cache_key = ('supplier', reagent_name)
+        data_version = _data_version
+        cached = _get_cached_reagent_lookup(cache_key)
+        if cached is not None:
+            return jsonify(cached)
+        
+        # 一次查詢該試劑名稱各（供應商, 單位）組合的使用次數
+        rows = db.session.execute(lambda_stmt(
+            lambda: db.select(
+                ReagentEntry.supplier,
+                ReagentEntry.unit,
+                db.func.count().label('usage_count')
+            ).where(
+                ReagentEntry.reagent_name == reagent_name
+            ).group_by(
+                ReagentEntry.supplier,
+                ReagentEntry.unit
+            )
+        )).all()
+        
+        if not rows:
+            _cache_reagent_lookup(cache_key, {'found': False}, data_version)
             return jsonify({'found': False})
         
-        result = {'found': True}
+        # 分別統計最常用的供應商和單位
+        supplier_counts = Counter()
+        unit_counts = Counter()
+        for supplier, unit, usage_count in rows:
+            supplier_counts[supplier] += usage_count
+            unit_counts[unit] += usage_count
         
-        if supplier_query:
-            result['supplier'] = supplier_query[0]
-            result['supplier_usage_count'] = supplier_query[1]
+        supplier, supplier_usage_count = supplier_counts.most_common(1)[0]
+        unit, unit_usage_count = unit_counts.most_common(1)[0]
         
-        if unit_query:
-            result['unit'] = unit_query[0]
-            result['unit_usage_count'] = unit_query[1]
+        result = {
+            'found': True,
+            'supplier': supplier,
+            'supplier_usage_count': supplier_usage_count,
+            'unit': unit,
+            'unit_usage_count': unit_usage_count
+        }
+        _cache_reagent_lookup(cache_key, result, data_version)
         
         return jsonify(result)
         
@@ -825,21 +1372,30 @@ def get_batch_expiry():
             return jsonify({'found': False})
         
         # 查詢特定批號的穩定效期
-        entry = ReagentEntry.query.filter_by(
-            reagent_name=reagent_name,
-            reagent_batch_number=batch_number
-        ).order_by(ReagentEntry.entry_date.desc()).first()
-        
-        if not entry:
+        # 只取需要的欄位，不建立 ORM 物件
+        row = db.session.execute(lambda_stmt(
+            lambda: db.select(
+                ReagentEntry.expiry_date,
+                ReagentEntry.entry_date,
+                ReagentEntry.quantity,
+                ReagentEntry.unit
+            ).where(
+                ReagentEntry.reagent_name == reagent_name,
+                ReagentEntry.reagent_batch_number == batch_number
+            ).order_by(ReagentEntry.entry_date.desc()).limit(1)
+        )).first()
+        
+        if row is None:
             return jsonify({'found': False, 'is_new_batch': True})
         
+        expiry_date, entry_date, quantity, unit = row
         return jsonify({
             'found': True,
             'is_new_batch': False,
-            'expiry_date': entry.expiry_date.strftime('%Y-%m-%d'),
-            'last_entry_date': entry.entry_date.strftime('%Y-%m-%d'),
-            'previous_quantity': entry.quantity,
-            'previous_unit': entry.unit
+            'expiry_date': expiry_date.isoformat(),  # YYYY-MM-DD
+            'last_entry_date': entry_date.date().isoformat(),
+            'previous_quantity': quantity,
+            'previous_unit': unit
         })
         
     except Exception as e:
@@ -855,35 +1411,49 @@ def get_reagent_batches():
         if not reagent_name:
             return jsonify([])
         
+        cache_key = ('batches', reagent_name)
+        data_version = _data_version
+        cached = _get_cached_reagent_lookup(cache_key)
+        if cached is not None:
+            return _json_response(cached)
+        
         # 獲取該試劑的所有批號及其最新效期
-        batches = db.session.query(
-            ReagentEntry.reagent_batch_number,
-            ReagentEntry.expiry_date,
-            db.func.max(ReagentEntry.entry_date).label('latest_date')
-        ).filter_by(
-            reagent_name=reagent_name
-        ).group_by(
-            ReagentEntry.reagent_batch_number
-        ).order_by(
-            db.func.max(ReagentEntry.entry_date).desc()
-        ).all()
+        batches = db.session.execute(lambda_stmt(
+            lambda: db.select(
+                ReagentEntry.reagent_batch_number,
+                ReagentEntry.expiry_date,
+                db.func.max(ReagentEntry.entry_date).label('latest_date')
+            ).where(
+                ReagentEntry.reagent_name == reagent_name
+            ).group_by(
+                ReagentEntry.reagent_batch_number
+            ).order_by(
+                db.func.max(ReagentEntry.entry_date).desc()
+            )
+        )).all()
         
         result = []
         for batch in batches:
             result.append({
                 'batch_number': batch[0],
-                'expiry_date': batch[1].strftime('%Y-%m-%d'),
-                'latest_entry': batch[2].strftime('%Y-%m-%d')
+                'expiry_date': batch[1].isoformat(),  # YYYY-MM-DD
+                'latest_entry': batch[2].date().isoformat()
             })
+        _cache_reagent_lookup(cache_key, result, data_version)
         
-        return jsonify(result)
+        return _json_response(result)
         
     except Exception as e:
         print(f"獲取試劑批號失敗: {e}")
         return jsonify([])
 
+@functools.lru_cache(maxsize=1)
 def get_chinese_font():
-    """獲取可用的中文字體（粗體）"""
+    """獲取可用的中文字體（粗體），字型只在第一次呼叫時註冊"""
+    return _register_chinese_font()
+
+def _register_chinese_font():
+    """註冊中文字體到 ReportLab，返回字體名稱"""
     try:
         # 嘗試註冊微軟正黑體粗體
         font_path = "C:/Windows/Fonts/msjhbd.ttc"
@@ -923,6 +1493,32 @@ def get_chinese_font():
     # 使用預設粗體字體
     return 'Helvetica-Bold'
 
+# ZPL 標籤版面
+# 標籤尺寸：5cm x 3.5cm (203 DPI)
+# 50mm = 394 dots, 35mm = 276 dots
+ZPL_LABEL_WIDTH_DOTS = 394  # 50mm at 203 DPI (正確計算：50 * 203 / 25.4 ≈ 394)
+ZPL_LABEL_HEIGHT_DOTS = 276  # 35mm at 203 DPI (正確計算：35 * 203 / 25.4 ≈ 276)
+ZPL_BORDER_THICKNESS = 2
+
+# 標籤開頭與尺寸 (以點為單位，203 DPI)
+_ZPL_LABEL_START = f"^XA\n^PW{ZPL_LABEL_WIDTH_DOTS}\n^LL{ZPL_LABEL_HEIGHT_DOTS}\n"
+# 新批號：雙邊框（外層粗線 + 內層細線）
+_ZPL_BORDER_FIRST = (
+    f"^FO5,5^GB{ZPL_LABEL_WIDTH_DOTS - 10},{ZPL_LABEL_HEIGHT_DOTS - 10},{ZPL_BORDER_THICKNESS * 3}^FS\n"
+    f"^FO10,10^GB{ZPL_LABEL_WIDTH_DOTS - 20},{ZPL_LABEL_HEIGHT_DOTS - 20},{ZPL_BORDER_THICKNESS}^FS\n"
+)
+# 一般標籤：單邊框
+_ZPL_BORDER_NORMAL = f"^FO5,5^GB{ZPL_LABEL_WIDTH_DOTS - 10},{ZPL_LABEL_HEIGHT_DOTS - 10},{ZPL_BORDER_THICKNESS}^FS\n"
+# 各行的 Y 座標（從 25 開始，每行間隔 30）：
+# 【入庫】、試劑名稱、試劑批號、穩定效期、入庫日期、【出庫】、人員/出庫日期
+_ZPL_ROW_Y = (25, 55, 85, 115, 145, 175, 205)
+# 各欄位的 X 座標
+_ZPL_X_LABEL = 20  # 標題文字（如「試劑名稱:」）
+_ZPL_LABEL_WIDTH_EST = 80  # 估算標題文字的寬度
+_ZPL_CHAR_SPACING = 22  # 一個中文字距離
+_ZPL_X_FIELD = _ZPL_X_LABEL + _ZPL_LABEL_WIDTH_EST + _ZPL_CHAR_SPACING  # 欄位內容（122）
+_ZPL_X_MARKER = _ZPL_X_FIELD + 100  # 批號圖形（約100點寬）之後的新批號/允收合格標記（222）
+
 def generate_zpl_labels(entry, quantity=None, is_new_batch=False):
     """
     生成ZPL格式的標籤指令 (使用圖形模式，確保中文正確顯示)
@@ -933,13 +1529,6 @@ def generate_zpl_labels(entry, quantity=None, is_new_batch=False):
     if quantity is None:
         quantity = entry.quantity
     
-    zpl_commands = []
-    
-    # 標籤尺寸：5cm x 3.5cm (203 DPI)
-    # 50mm = 394 dots, 35mm = 276 dots
-    label_width_dots = 394  # 50mm at 203 DPI (正確計算：50 * 203 / 25.4 ≈ 394)
-    label_height_dots = 276  # 35mm at 203 DPI (正確計算：35 * 203 / 25.4 ≈ 276)
-    
     # 準備動態文字的圖形
     dynamic_graphics = {}  # 儲存圖形定義的 ZPL 指令
     dynamic_graphic_names = {}  # 儲存圖形項目名稱
@@ -952,7 +1541,7 @@ def generate_zpl_labels(entry, quantity=None, is_new_batch=False):
     
     # 生成試劑名稱圖形
     if reagent_name:
-        item_name = f"ITEM_REAGENT_NAME_DYN_{hash(reagent_name) % 10000}"
+        item_name = f"ITEM_REAGENT_NAME_DYN_{_zpl_graphic_id(reagent_name)}"
         name_graphic = _text_to_zpl_graphic(reagent_name, item_name)
         if name_graphic:
             dynamic_graphics['reagent_name'] = name_graphic
@@ -960,7 +1549,7 @@ def generate_zpl_labels(entry, quantity=None, is_new_batch=False):
     
     # 生成批號圖形
     if batch_number:
-        item_name = f"ITEM_BATCH_DYN_{hash(batch_number) % 10000}"
+        item_name = f"ITEM_BATCH_DYN_{_zpl_graphic_id(batch_number)}"
         batch_graphic = _text_to_zpl_graphic(batch_number, item_name)
         if batch_graphic:
             dynamic_graphics['batch_number'] = batch_graphic
@@ -968,197 +1557,164 @@ def generate_zpl_labels(entry, quantity=None, is_new_batch=False):
     
     # 生成日期圖形
     if expiry_str:
-        item_name = f"ITEM_EXPIRY_DYN_{hash(expiry_str) % 10000}"
+        item_name = f"ITEM_EXPIRY_DYN_{_zpl_graphic_id(expiry_str)}"
         expiry_graphic = _text_to_zpl_graphic(expiry_str, item_name)
         if expiry_graphic:
             dynamic_graphics['expiry'] = expiry_graphic
             dynamic_graphic_names['expiry'] = item_name
     
     if entry_str:
-        item_name = f"ITEM_ENTRY_DYN_{hash(entry_str) % 10000}"
+        item_name = f"ITEM_ENTRY_DYN_{_zpl_graphic_id(entry_str)}"
         entry_graphic = _text_to_zpl_graphic(entry_str, item_name)
         if entry_graphic:
             dynamic_graphics['entry_date'] = entry_graphic
             dynamic_graphic_names['entry_date'] = item_name
     
-    for i in range(quantity):
-        zpl = "^XA\n"  # 開始標籤
-        
-        # 設定標籤尺寸 (以點為單位，203 DPI)
-        zpl += f"^PW{label_width_dots}\n"  # 設定列印寬度
-        zpl += f"^LL{label_height_dots}\n"  # 設定標籤長度
-        
-        # 只有第一張標籤是新批號格式（當is_new_batch為True時）
-        is_first_label = is_new_batch and i == 0
-        
-        # 繪製邊框
-        border_thickness = 2
-        if is_first_label:
-            # 新批號：雙邊框
-            # 外層邊框 (粗線)
-            outer_x, outer_y = 5, 5
-            outer_w = label_width_dots - 10
-            outer_h = label_height_dots - 10
-            zpl += f"^FO{outer_x},{outer_y}^GB{outer_w},{outer_h},{border_thickness * 3}^FS\n"
-            # 內層邊框 (細線)
-            inner_x, inner_y = 10, 10
-            inner_w = label_width_dots - 20
-            inner_h = label_height_dots - 20
-            zpl += f"^FO{inner_x},{inner_y}^GB{inner_w},{inner_h},{border_thickness}^FS\n"
-        else:
-            # 一般標籤：單邊框
-            border_x, border_y = 5, 5
-            border_w = label_width_dots - 10
-            border_h = label_height_dots - 10
-            zpl += f"^FO{border_x},{border_y}^GB{border_w},{border_h},{border_thickness}^FS\n"
-        
-        # ========== 使用圖形模式顯示文字 ==========
-        # 先定義固定圖形（如果可用）
-        for key, graphic_def in ZPL_FIXED_GRAPHICS.items():
-            zpl += graphic_def + "\n"
-        
-        # 定義動態圖形（每個標籤都需要定義一次）
-        for key, graphic_def in dynamic_graphics.items():
-            zpl += graphic_def + "\n"
-        
-        y_pos = 25  # 起始Y位置
+    # ========== 使用圖形模式顯示文字 ==========
+    # 固定圖形與動態圖形定義（每個標籤都完整定義一次，同一個列印工作中重複的定義在送出時才省略，
+    # 保存的 .zpl 檔案因此每張標籤都可單獨使用）
+    graphic_defs = _FIXED_GRAPHICS_STR + "".join(
+        graphic_def + "\n" for graphic_def in dynamic_graphics.values()
+    )
+    
+    def build_body(is_first_label):
+        """組合標籤內文（只有批號行的新批號/允收合格標記會因第一張標籤而不同）"""
+        parts = []
+        y_in, y_name, y_batch, y_expiry, y_entry, y_out, y_checkout = _ZPL_ROW_Y
         
         # 【入庫】標題
         if "IN" in ZPL_FIXED_GRAPHICS:
-            zpl += f"^FO20,{y_pos}^XGITEM_IN^FS\n"
+            parts.append(f"^FO20,{y_in}^XGITEM_IN^FS\n")
         else:
             # 備用方案：使用字型
-            zpl += f"^FO20,{y_pos}^A0N,22,22^FD【入庫】^FS\n"
-        y_pos += 30
+            parts.append(f"^FO20,{y_in}^A0N,22,22^FD【入庫】^FS\n")
         
         # 試劑名稱
         if "REAGENT_NAME" in ZPL_FIXED_GRAPHICS:
-            zpl += f"^FO20,{y_pos}^XGITEM_REAGENT_NAME^FS\n"
-            label_width = 80  # 估算「試劑名稱:」的寬度
-            char_spacing = 22  # 一個中文字距離
+            parts.append(f"^FO20,{y_name}^XGITEM_REAGENT_NAME^FS\n")
             if 'reagent_name' in dynamic_graphic_names:
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^XG{dynamic_graphic_names['reagent_name']}^FS\n"
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_name}^XG{dynamic_graphic_names['reagent_name']}^FS\n")
             else:
                 # 備用方案：使用字型
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^A0N,22,22^FD{reagent_name}^FS\n"
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_name}^A0N,22,22^FD{reagent_name}^FS\n")
         else:
             # 如果沒有固定圖形，使用動態圖形或字型（比照試劑批號的方式）
             reagent_text = f"試劑名稱:{reagent_name}"
             if 'reagent_name' in dynamic_graphic_names:
                 # 使用字型顯示「試劑名稱:」標籤，然後顯示動態圖形
-                zpl += f"^FO20,{y_pos}^A0N,22,22^FD試劑名稱:^FS\n"
-                label_width = 80  # 估算「試劑名稱:」的寬度
-                char_spacing = 22  # 一個中文字距離
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^XG{dynamic_graphic_names['reagent_name']}^FS\n"
+                parts.append(f"^FO20,{y_name}^A0N,22,22^FD試劑名稱:^FS\n")
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_name}^XG{dynamic_graphic_names['reagent_name']}^FS\n")
             else:
                 # 如果動態圖形也失敗，顯示完整文字
-                zpl += f"^FO20,{y_pos}^A0N,22,22^FD{reagent_text}^FS\n"
-        y_pos += 30
+                parts.append(f"^FO20,{y_name}^A0N,22,22^FD{reagent_text}^FS\n")
         
         # 試劑批號
         if "BATCH" in ZPL_FIXED_GRAPHICS:
-            zpl += f"^FO20,{y_pos}^XGITEM_BATCH^FS\n"
-            label_width = 80  # 估算「試劑批號:」的寬度
-            char_spacing = 22  # 一個中文字距離
+            parts.append(f"^FO20,{y_batch}^XGITEM_BATCH^FS\n")
             if 'batch_number' in dynamic_graphic_names:
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^XG{dynamic_graphic_names['batch_number']}^FS\n"
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_batch}^XG{dynamic_graphic_names['batch_number']}^FS\n")
             else:
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^A0N,22,22^FD{batch_number}^FS\n"
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_batch}^A0N,22,22^FD{batch_number}^FS\n")
             
             # 新批號標記或允收合格標記
             if is_first_label:
                 if "NEW_BATCH" in ZPL_FIXED_GRAPHICS:
                     # 計算批號圖形的寬度（約100點），然後顯示新批號標記
-                    zpl += f"^FO{20 + label_width + char_spacing + 100},{y_pos}^XGITEM_NEW_BATCH^FS\n"
+                    parts.append(f"^FO{_ZPL_X_MARKER},{y_batch}^XGITEM_NEW_BATCH^FS\n")
                 else:
                     # 使用粗體字型顯示新批號標記
-                    zpl += f"^FO{20 + label_width + char_spacing + 100},{y_pos}^A0B,22,22^FD>>新批號<<^FS\n"
+                    parts.append(f"^FO{_ZPL_X_MARKER},{y_batch}^A0B,22,22^FD>>新批號<<^FS\n")
             else:
                 if "QUALIFIED" in ZPL_FIXED_GRAPHICS:
-                    zpl += f"^FO{20 + label_width + char_spacing + 100},{y_pos}^XGITEM_QUALIFIED^FS\n"
+                    parts.append(f"^FO{_ZPL_X_MARKER},{y_batch}^XGITEM_QUALIFIED^FS\n")
                 else:
-                    zpl += f"^FO{20 + label_width + char_spacing + 100},{y_pos}^A0N,22,22^FD(允收合格)^FS\n"
+                    parts.append(f"^FO{_ZPL_X_MARKER},{y_batch}^A0N,22,22^FD(允收合格)^FS\n")
         else:
             # 如果沒有固定圖形，使用動態圖形或字型
             if is_first_label:
                 batch_text = f"試劑批號:{batch_number} >>新批號<<"
                 # 使用粗體字型顯示新批號標記
                 if 'batch_number' in dynamic_graphic_names:
-                    zpl += f"^FO20,{y_pos}^A0N,22,22^FD試劑批號:^FS\n"
-                    char_spacing = 22  # 一個中文字距離
-                    zpl += f"^FO{20 + 80 + char_spacing},{y_pos}^XG{dynamic_graphic_names['batch_number']}^FS\n"
-                    zpl += f"^FO{20 + 80 + char_spacing + 100},{y_pos}^A0B,22,22^FD>>新批號<<^FS\n"
+                    parts.append(f"^FO20,{y_batch}^A0N,22,22^FD試劑批號:^FS\n")
+                    parts.append(f"^FO{_ZPL_X_FIELD},{y_batch}^XG{dynamic_graphic_names['batch_number']}^FS\n")
+                    parts.append(f"^FO{_ZPL_X_MARKER},{y_batch}^A0B,22,22^FD>>新批號<<^FS\n")
                 else:
-                    zpl += f"^FO20,{y_pos}^A0N,22,22^FD試劑批號:{batch_number} ^FS\n"
+                    parts.append(f"^FO20,{y_batch}^A0N,22,22^FD試劑批號:{batch_number} ^FS\n")
                     # 計算批號文字的寬度後顯示粗體新批號標記
-                    zpl += f"^FO{20 + 80 + 22 + len(batch_number) * 11},{y_pos}^A0B,22,22^FD>>新批號<<^FS\n"
+                    parts.append(f"^FO{_ZPL_X_FIELD + len(batch_number) * 11},{y_batch}^A0B,22,22^FD>>新批號<<^FS\n")
             else:
                 batch_text = f"試劑批號:{batch_number} (允收合格)"
                 if 'batch_number' in dynamic_graphic_names:
-                    zpl += f"^FO20,{y_pos}^XG{dynamic_graphic_names['batch_number']}^FS\n"
+                    parts.append(f"^FO20,{y_batch}^XG{dynamic_graphic_names['batch_number']}^FS\n")
                 else:
-                    zpl += f"^FO20,{y_pos}^A0N,22,22^FD{batch_text}^FS\n"
-        y_pos += 30
+                    parts.append(f"^FO20,{y_batch}^A0N,22,22^FD{batch_text}^FS\n")
         
         # 穩定效期
         if "EXPIRY" in ZPL_FIXED_GRAPHICS:
-            zpl += f"^FO20,{y_pos}^XGITEM_EXPIRY^FS\n"
-            label_width = 80
-            char_spacing = 22  # 一個中文字距離
+            parts.append(f"^FO20,{y_expiry}^XGITEM_EXPIRY^FS\n")
             if 'expiry' in dynamic_graphic_names:
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^XG{dynamic_graphic_names['expiry']}^FS\n"
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_expiry}^XG{dynamic_graphic_names['expiry']}^FS\n")
             else:
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^A0N,22,22^FD{expiry_str}^FS\n"
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_expiry}^A0N,22,22^FD{expiry_str}^FS\n")
         else:
             if 'expiry' in dynamic_graphic_names:
-                zpl += f"^FO20,{y_pos}^A0N,22,22^FD穩定效期:^FS\n"
-                char_spacing = 22  # 一個中文字距離
-                zpl += f"^FO{20 + 80 + char_spacing},{y_pos}^XG{dynamic_graphic_names['expiry']}^FS\n"
+                parts.append(f"^FO20,{y_expiry}^A0N,22,22^FD穩定效期:^FS\n")
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_expiry}^XG{dynamic_graphic_names['expiry']}^FS\n")
             else:
-                zpl += f"^FO20,{y_pos}^A0N,22,22^FD穩定效期:{expiry_str}^FS\n"
-        y_pos += 30
+                parts.append(f"^FO20,{y_expiry}^A0N,22,22^FD穩定效期:{expiry_str}^FS\n")
         
         # 入庫日期
         if "ENTRY_DATE" in ZPL_FIXED_GRAPHICS:
-            zpl += f"^FO20,{y_pos}^XGITEM_ENTRY_DATE^FS\n"
-            label_width = 80
-            char_spacing = 22  # 一個中文字距離
+            parts.append(f"^FO20,{y_entry}^XGITEM_ENTRY_DATE^FS\n")
             if 'entry_date' in dynamic_graphic_names:
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^XG{dynamic_graphic_names['entry_date']}^FS\n"
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_entry}^XG{dynamic_graphic_names['entry_date']}^FS\n")
             else:
-                zpl += f"^FO{20 + label_width + char_spacing},{y_pos}^A0N,22,22^FD{entry_str}^FS\n"
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_entry}^A0N,22,22^FD{entry_str}^FS\n")
         else:
             if 'entry_date' in dynamic_graphic_names:
-                zpl += f"^FO20,{y_pos}^A0N,22,22^FD入庫日期:^FS\n"
-                char_spacing = 22  # 一個中文字距離
-                zpl += f"^FO{20 + 80 + char_spacing},{y_pos}^XG{dynamic_graphic_names['entry_date']}^FS\n"
+                parts.append(f"^FO20,{y_entry}^A0N,22,22^FD入庫日期:^FS\n")
+                parts.append(f"^FO{_ZPL_X_FIELD},{y_entry}^XG{dynamic_graphic_names['entry_date']}^FS\n")
             else:
-                zpl += f"^FO20,{y_pos}^A0N,22,22^FD入庫日期:{entry_str}^FS\n"
-        y_pos += 30
+                parts.append(f"^FO20,{y_entry}^A0N,22,22^FD入庫日期:{entry_str}^FS\n")
         
         # 【出庫】標題
         if "OUT" in ZPL_FIXED_GRAPHICS:
-            zpl += f"^FO20,{y_pos}^XGITEM_OUT^FS\n"
+            parts.append(f"^FO20,{y_out}^XGITEM_OUT^FS\n")
         else:
-            zpl += f"^FO20,{y_pos}^A0N,22,22^FD【出庫】^FS\n"
-        y_pos += 30
+            parts.append(f"^FO20,{y_out}^A0N,22,22^FD【出庫】^FS\n")
         
         # 出庫資訊
         if "PERSON" in ZPL_FIXED_GRAPHICS:
-            zpl += f"^FO20,{y_pos}^XGITEM_PERSON^FS\n"
+            parts.append(f"^FO20,{y_checkout}^XGITEM_PERSON^FS\n")
         else:
-            zpl += f"^FO20,{y_pos}^A0N,22,22^FD人員^FS\n"
+            parts.append(f"^FO20,{y_checkout}^A0N,22,22^FD人員^FS\n")
         
         if "CHECKOUT_DATE" in ZPL_FIXED_GRAPHICS:
-            zpl += f"^FO190,{y_pos}^XGITEM_CHECKOUT_DATE^FS\n"
+            parts.append(f"^FO190,{y_checkout}^XGITEM_CHECKOUT_DATE^FS\n")
         else:
-            zpl += f"^FO190,{y_pos}^A0N,22,22^FD出庫日期^FS\n"
+            parts.append(f"^FO190,{y_checkout}^A0N,22,22^FD出庫日期^FS\n")
         
-        zpl += "^XZ\n"  # 結束標籤
-        
-        zpl_commands.append(zpl)
+        return "".join(parts)
+    
+    def build_label(is_first_label):
+        """組合完整的單張標籤"""
+        return "".join((
+            _ZPL_LABEL_START,
+            _ZPL_BORDER_FIRST if is_first_label else _ZPL_BORDER_NORMAL,
+            graphic_defs,
+            build_body(is_first_label),
+            "^XZ\n"  # 結束標籤
+        ))
     
-    return zpl_commands
+    # 同一批標籤只有兩種內容：一般標籤與第一張新批號標籤，各組合一次後重複使用
+    label_normal = build_label(False)
+    if not is_new_batch or quantity <= 0:
+        return [label_normal] * quantity
+    
+    # 只有第一張標籤是新批號格式（當is_new_batch為True時）
+    return [build_label(True)] + [label_normal] * (quantity - 1)
+
+ZPL_WRITE_CHUNK_SIZE = 1024 * 1024  # 單次 WritePrinter 的最大位元組數 (1 MiB)
 
 def send_zpl_to_printer(zpl_commands):
     """
@@ -1181,13 +1737,14 @@ def send_zpl_to_printer(zpl_commands):
             job_id = win32print.StartDocPrinter(printer_handle, 1, ("ZPL Label UTF-8", None, "RAW"))
             win32print.StartPagePrinter(printer_handle)
             
-            # 發送每個ZPL指令 (確保UTF-8編碼)
-            for i, zpl in enumerate(zpl_commands):
-                # 確保ZPL指令使用UTF-8編碼
-                # 這樣印表機可以正確解析 ^CI28 指令並使用 Unicode 尋找字形
-                zpl_bytes = zpl.encode('utf-8')
-                win32print.WritePrinter(printer_handle, zpl_bytes)
-                print(f"已發送第 {i+1} 張標籤的ZPL指令 (UTF-8編碼)")
+            # 所有標籤合併後一次編碼 (確保UTF-8編碼)
+            # 這樣印表機可以正確解析 ^CI28 指令並使用 Unicode 尋找字形
+            # 圖形定義只在本工作第一次用到時傳送
+            payload = "".join(_dedupe_graphic_defs(zpl_commands)).encode('utf-8')
+            # 合併成連續資料送出，過大時分段以限制多工緩衝區的單次寫入量
+            for offset in range(0, len(payload), ZPL_WRITE_CHUNK_SIZE):
+                win32print.WritePrinter(printer_handle, payload[offset:offset + ZPL_WRITE_CHUNK_SIZE])
+            print(f"已發送 {len(zpl_commands)} 張標籤的ZPL指令 (UTF-8編碼，{len(payload)} 位元組)")
             
             # 結束列印
             win32print.EndPagePrinter(printer_handle)
@@ -1206,6 +1763,43 @@ def send_zpl_to_printer(zpl_commands):
         traceback.print_exc()
         return False
 
+def save_zpl_to_file(zpl_commands, header_lines):
+    """
+    將ZPL指令保存為文字檔（印表機無法使用時讓用戶手動處理或測試）
+    - header_lines: 檔案開頭的說明文字（每行一項）
+    返回是否保存成功
+    """
+    try:
+        # 生成帶時間戳的ZPL文件名
+        timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
+        zpl_filename = f"zpl_labels_{timestamp}.zpl"
+        zpl_filepath = os.path.join(APP_DIR, zpl_filename)
+        
+        with open(zpl_filepath, 'w', encoding='utf-8') as f:
+            f.write(f"# ZPL標籤指令 - 生成時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+            for line in header_lines:
+                f.write(f"# {line}\n")
+            f.write("# " + "="*50 + "\n\n")
+            
+            for i, zpl in enumerate(zpl_commands):
+                f.write(f"# 第 {i+1} 張標籤\n")
+                f.write(zpl)
+                f.write('\n\n')  # 分隔符
+        
+        print(f"ZPL指令已保存到: {zpl_filepath}")
+        print("您可以使用ZPL Viewer開啟此檔案預覽標籤效果")
+        
+        # 嘗試用記事本開啟
+        try:
+            subprocess.Popen(['notepad.exe', zpl_filepath])
+        except:
+            print("無法自動開啟ZPL檔案，請手動開啟")
+        
+        return True
+    except Exception as e:
+        print(f"保存ZPL檔案失敗: {e}")
+        return False
+
 def generate_and_print_labels(entry, quantity=None, is_new_batch=False, printer_type="zpl"):
     """
     統一的標籤生成和列印函數
@@ -1232,42 +1826,98 @@ def generate_and_print_labels(entry, quantity=None, is_new_batch=False, printer_
             return quantity
         else:
             # ZPL列印失敗，保存為文字檔讓用戶手動處理或測試
-            try:
-                # 生成帶時間戳的ZPL文件名
-                timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-                zpl_filename = f"zpl_labels_{timestamp}.zpl"
-                zpl_filepath = os.path.join(APP_DIR, zpl_filename)
-                
-                with open(zpl_filepath, 'w', encoding='utf-8') as f:
-                    f.write(f"# ZPL標籤指令 - 生成時間: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-                    f.write(f"# 試劑名稱: {entry.reagent_name}\n")
-                    f.write(f"# 批號: {entry.reagent_batch_number}\n")
-                    f.write(f"# 新批號: {'是' if is_new_batch else '否'}\n")
-                    f.write(f"# 數量: {quantity}\n")
-                    f.write("# " + "="*50 + "\n\n")
-                    
-                    for i, zpl in enumerate(zpl_commands):
-                        f.write(f"# 第 {i+1} 張標籤\n")
-                        f.write(zpl)
-                        f.write('\n\n')  # 分隔符
-                
-                print(f"ZPL指令已保存到: {zpl_filepath}")
-                print("您可以使用ZPL Viewer開啟此檔案預覽標籤效果")
-                
-                # 嘗試用記事本開啟
-                try:
-                    subprocess.Popen(['notepad.exe', zpl_filepath])
-                except:
-                    print("無法自動開啟ZPL檔案，請手動開啟")
-                
-                return quantity
-            except Exception as e:
-                print(f"保存ZPL檔案失敗: {e}")
-                return 0
+            saved = save_zpl_to_file(zpl_commands, [
+                f"試劑名稱: {entry.reagent_name}",
+                f"批號: {entry.reagent_batch_number}",
+                f"新批號: {'是' if is_new_batch else '否'}",
+                f"數量: {quantity}",
+            ])
+            return quantity if saved else 0
     # else:
     #     # 使用PDF模式 (原有邏輯) - 已註銷，不再執行
     #     # return generate_pdf_labels(entry, quantity, is_new_batch)
 
+def generate_and_print_label_batch(items):
+    """
+    多筆記錄的標籤合併為一個列印工作（ZPL模式）
+    - items: [(資料庫記錄, 列印數量, 是否為新批號), ...]
+    返回列印的標籤張數
+    """
+    zpl_commands = []
+    for entry, quantity, is_new_batch in items:
+        zpl_commands.extend(generate_zpl_labels(entry, quantity, is_new_batch))
+    
+    # 所有記錄的標籤一次送出，只需開啟一次印表機與列印工作
+    if send_zpl_to_printer(zpl_commands):
+        print(f"ZPL標籤批次列印成功: {len(items)} 筆記錄，共 {len(zpl_commands)} 張")
+        return len(zpl_commands)
+    
+    # ZPL列印失敗，保存為文字檔讓用戶手動處理或測試
+    header_lines = [
+        f"試劑名稱: {entry.reagent_name} / 批號: {entry.reagent_batch_number} / "
+        f"新批號: {'是' if is_new_batch else '否'} / 數量: {quantity}"
+        for entry, quantity, is_new_batch in items
+    ]
+    return len(zpl_commands) if save_zpl_to_file(zpl_commands, header_lines) else 0
+
+# PDF 標籤版面
+# 標籤尺寸：5cm x 3.5cm（橫向）
+PDF_LABEL_WIDTH = 50 * mm
+PDF_LABEL_HEIGHT = 35 * mm
+# 各行的 Y 座標：
+# 【入庫】、試劑名稱、試劑批號、穩定效期、入庫時間、【出庫】、人員/出庫日期
+_PDF_ROW_Y = (29 * mm, 25 * mm, 21 * mm, 17 * mm, 13 * mm, 8 * mm, 4 * mm)
+# 各欄位的 X 座標
+_PDF_X_TEXT = 2 * mm  # 文字左側
+_PDF_X_OUT_DATE = 25 * mm  # 「出庫日期：」
+
+def _draw_label_text(c, font_name, name_line, batch_line, expiry_line, entry_line):
+    """以單一文字物件繪製標籤上的所有文字（整張標籤只有一個 BT/ET 文字區塊）"""
+    y_in, y_name, y_batch, y_expiry, y_entry, y_out, y_staff = _PDF_ROW_Y
+    text = c.beginText()
+    
+    # 標題（粗體）
+    text.setFont(font_name, 10)
+    text.setTextOrigin(_PDF_X_TEXT, y_in)
+    text.textOut("【入庫】")
+    
+    # 入庫資料（垂直排列，粗體）
+    text.setFont(font_name, 8)
+    for y, line in ((y_name, name_line), (y_batch, batch_line),
+                    (y_expiry, expiry_line), (y_entry, entry_line)):
+        text.setTextOrigin(_PDF_X_TEXT, y)
+        text.textOut(line)
+    
+    # 出庫標題（粗體）
+    text.setFont(font_name, 10)
+    text.setTextOrigin(_PDF_X_TEXT, y_out)
+    text.textOut("【出庫】")
+    
+    # 出庫人員和日期（留白給蓋章用，粗體）
+    text.setFont(font_name, 8)
+    text.setTextOrigin(_PDF_X_TEXT, y_staff)
+    text.textOut("人員：")
+    text.setTextOrigin(_PDF_X_OUT_DATE, y_staff)
+    text.textOut("出庫日期：")
+    
+    c.drawText(text)
+
+# 標籤 PDF 暫存目錄：每次執行共用一個目錄，程式結束時整個刪除，不會在暫存資料夾累積檔案
+_label_pdf_dir = None
+_label_pdf_dir_lock = threading.Lock()
+_label_pdf_ids = itertools.count(1)
+
+def _new_label_pdf_path(entry):
+    """在標籤暫存目錄中取得新的 PDF 路徑（第一次使用時才建立目錄）"""
+    global _label_pdf_dir
+    with _label_pdf_dir_lock:
+        if _label_pdf_dir is None:
+            _label_pdf_dir = tempfile.mkdtemp(prefix='rstorage_labels_')
+            # PDF 閱讀器可能仍開著檔案，刪除失敗時忽略
+            atexit.register(shutil.rmtree, _label_pdf_dir, ignore_errors=True)
+    # 每次使用不同檔名，避免覆寫 PDF 閱讀器仍開啟中的檔案
+    return os.path.join(_label_pdf_dir, f"label_{entry.id}_{next(_label_pdf_ids)}.pdf")
+
 def print_pdf_direct(entry, quantity=None, is_new_batch=False):
     """
     PDF直接列印函數 - 恢復原本的列印邏輯
@@ -1275,60 +1925,51 @@ def print_pdf_direct(entry, quantity=None, is_new_batch=False):
     if quantity is None:
         quantity = entry.quantity
     
-    # 標籤尺寸：5cm x 3.5cm（橫向）
-    label_width = 50 * mm  # 5cm（寬度）
-    label_height = 35 * mm  # 3.5cm（高度）
+    label_width = PDF_LABEL_WIDTH
+    label_height = PDF_LABEL_HEIGHT
     
     # 建立標籤PDF
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+    pdf_path = _new_label_pdf_path(entry)
     # 創建PDF文檔（橫向頁面：寬度 > 高度）
-    c = canvas.Canvas(temp_file.name, pagesize=(label_width, label_height))
+    c = canvas.Canvas(pdf_path, pagesize=(label_width, label_height))
     
     # 獲取中文字體
     font_name = get_chinese_font()
     
+    # 每頁相同的文字只組合一次
+    name_line = f"試劑名稱：{entry.reagent_name}"
+    # 試劑批號（根據是否新批號顯示不同內容）
+    if is_new_batch:
+        batch_line = f"試劑批號：{entry.reagent_batch_number} >>新批號<<"
+    else:
+        batch_line = f"試劑批號：{entry.reagent_batch_number} (允收合格)"
+    expiry_line = f"穩定效期：{entry.expiry_date.strftime('%Y/%m/%d')}"
+    entry_line = f"入庫時間：{entry.entry_date.strftime('%Y/%m/%d')}"
+    
+    # 每頁標籤內容相同，定義為 Form XObject，每頁只需引用一次
+    c.beginForm('label')
+    
+    if is_new_batch:
+        # 新批號標籤：雙重邊框
+        # 外層邊框（粗邊框）
+        c.setLineWidth(2)
+        c.rect(0.5*mm, 0.5*mm, label_width-1*mm, label_height-1*mm)
+        # 內層邊框（細邊框）
+        c.setLineWidth(0.5)
+        c.rect(1.5*mm, 1.5*mm, label_width-3*mm, label_height-3*mm)
+    else:
+        # 舊批號標籤：單層邊框
+        c.setLineWidth(0.5)
+        c.rect(1*mm, 1*mm, label_width-2*mm, label_height-2*mm)
+    
+    # 標籤文字
+    _draw_label_text(c, font_name, name_line, batch_line, expiry_line, entry_line)
+    
+    c.endForm()
+    
     for i in range(quantity):
         # 直接繪製內容，不需要旋轉（PDF 本身就是橫向）
-        
-        if is_new_batch:
-            # 新批號標籤：雙重邊框
-            # 外層邊框（粗邊框）
-            c.setLineWidth(2)
-            c.rect(0.5*mm, 0.5*mm, label_width-1*mm, label_height-1*mm)
-            # 內層邊框（細邊框）
-            c.setLineWidth(0.5)
-            c.rect(1.5*mm, 1.5*mm, label_width-3*mm, label_height-3*mm)
-        else:
-            # 舊批號標籤：單層邊框
-            c.setLineWidth(0.5)
-            c.rect(1*mm, 1*mm, label_width-2*mm, label_height-2*mm)
-        
-        # 標題（粗體）
-        c.setFont(font_name, 10)
-        c.drawString(2*mm, 29*mm, "【入庫】")
-        
-        # 入庫資料（垂直排列，粗體）
-        c.setFont(font_name, 8)
-        c.drawString(2*mm, 25*mm, f"試劑名稱：{entry.reagent_name}")
-        
-        # 試劑批號（根據是否新批號顯示不同內容）
-        if is_new_batch:
-            batch_text = f"試劑批號：{entry.reagent_batch_number} >>新批號<<"
-        else:
-            batch_text = f"試劑批號：{entry.reagent_batch_number} (允收合格)"
-        c.drawString(2*mm, 21*mm, batch_text)
-        
-        c.drawString(2*mm, 17*mm, f"穩定效期：{entry.expiry_date.strftime('%Y/%m/%d')}")
-        c.drawString(2*mm, 13*mm, f"入庫時間：{entry.entry_date.strftime('%Y/%m/%d')}")
-        
-        # 出庫標題（粗體）
-        c.setFont(font_name, 10)
-        c.drawString(2*mm, 8*mm, "【出庫】")
-        
-        # 出庫人員和日期（粗體）
-        c.setFont(font_name, 8)
-        c.drawString(2*mm, 4*mm, "人員：")
-        c.drawString(25*mm, 4*mm, "出庫日期：")
+        c.doForm('label')
         
         if i < quantity - 1:
             c.showPage()
@@ -1353,7 +1994,7 @@ def print_pdf_direct(entry, quantity=None, is_new_batch=False):
                         sumatra_path, 
                         "-print-to-default", 
                         "-silent",
-                        temp_file.name
+                        pdf_path
                     ], check=True, timeout=30)
                     print("SumatraPDF 靜默列印命令已發送")
                     print("注意：如果列印方向不正確，請檢查印表機驅動的預設設定")
@@ -1363,19 +2004,19 @@ def print_pdf_direct(entry, quantity=None, is_new_batch=False):
             
             # 如果 SumatraPDF 不可用，使用系統命令列印PDF
             print("使用系統預設方式列印（可能不是靜默列印）")
-            win32api.ShellExecute(0, "print", temp_file.name, None, ".", 0)
+            win32api.ShellExecute(0, "print", pdf_path, None, ".", 0)
             
             return quantity
         else:
             # Windows列印功能不可用，開啟PDF讓用戶手動處理
-            subprocess.Popen(['start', temp_file.name], shell=True)
+            open_with_default_app(pdf_path)
             
             return quantity
         
     except Exception as e:
         print(f"直接列印失敗: {e}")
         # 如果直接列印失敗，開啟PDF讓用戶手動處理
-        subprocess.Popen(['start', temp_file.name], shell=True)
+        open_with_default_app(pdf_path)
         
         return quantity
 
@@ -1388,28 +2029,27 @@ def generate_pdf_labels(entry, quantity=None, is_new_batch=False):
     if quantity is None:
         quantity = entry.quantity
     
-    # 標籤尺寸：5cm x 3.5cm（橫向）
-    label_width = 50 * mm  # 5cm（寬度）
-    label_height = 35 * mm  # 3.5cm（高度）
+    label_width = PDF_LABEL_WIDTH
+    label_height = PDF_LABEL_HEIGHT
     
     # 建立標籤PDF
-    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
+    pdf_path = _new_label_pdf_path(entry)
     
     # 創建PDF文檔（橫向頁面：寬度 > 高度）
-    doc = canvas.Canvas(temp_file.name, pagesize=(label_width, label_height))
+    doc = canvas.Canvas(pdf_path, pagesize=(label_width, label_height))
     
     # 獲取中文字體
     font_name = get_chinese_font()
     
-    # 繪製每一頁標籤
-    for i in range(quantity):
-        print(f"正在生成第 {i+1} 張標籤...")
-        
-        # 只有第一張標籤是新批號格式（當is_new_batch為True時）
-        is_first_label = is_new_batch and i == 0
-        
-        # 直接繪製內容，不需要旋轉（PDF 本身就是橫向）
-        
+    # 每頁相同的文字只組合一次（批號行只有第一張新批號標籤不同）
+    name_line = f"試劑名稱：{entry.reagent_name}"
+    batch_line_first = f"試劑批號：{entry.reagent_batch_number} >>新批號<<"
+    batch_line_normal = f"試劑批號：{entry.reagent_batch_number} (允收合格)"
+    expiry_line = f"穩定效期：{entry.expiry_date.strftime('%Y/%m/%d')}"
+    entry_line = f"入庫時間：{entry.entry_date.strftime('%Y/%m/%d')}"
+    
+    def draw_label(is_first_label):
+        """繪製單張標籤內容（直接繪製，不需要旋轉，PDF 本身就是橫向）"""
         # 繪製邊框
         if is_first_label:
             # 新批號標籤：雙重邊框
@@ -1424,33 +2064,27 @@ def generate_pdf_labels(entry, quantity=None, is_new_batch=False):
             doc.setLineWidth(0.5)
             doc.rect(1*mm, 1*mm, label_width-2*mm, label_height-2*mm)
         
-        # 標題（粗體）
-        doc.setFont(font_name, 10)
-        doc.drawString(2*mm, 29*mm, "【入庫】")
-        
-        # 入庫資料（垂直排列，粗體）
-        doc.setFont(font_name, 8)
-        doc.drawString(2*mm, 25*mm, f"試劑名稱：{entry.reagent_name}")
-        
-        # 試劑批號（根據是否第一張決定顯示方式）
-        if is_first_label:
-            batch_text = f"試劑批號：{entry.reagent_batch_number} >>新批號<<"
-        else:
-            batch_text = f"試劑批號：{entry.reagent_batch_number} (允收合格)"
-        doc.drawString(2*mm, 21*mm, batch_text)
-        
-        # 其他資訊
-        doc.drawString(2*mm, 17*mm, f"穩定效期：{entry.expiry_date.strftime('%Y/%m/%d')}")
-        doc.drawString(2*mm, 13*mm, f"入庫時間：{entry.entry_date.strftime('%Y/%m/%d')}")
-        
-        # 出庫標題（粗體）
-        doc.setFont(font_name, 10)
-        doc.drawString(2*mm, 8*mm, "【出庫】")
+        # 標籤文字（試劑批號根據是否第一張決定顯示方式）
+        _draw_label_text(doc, font_name, name_line,
+                         batch_line_first if is_first_label else batch_line_normal,
+                         expiry_line, entry_line)
+    
+    # 標籤內容只有兩種（一般標籤與第一張新批號標籤），各定義為一個 Form XObject，
+    # 每頁只需引用，不必重複寫入相同的繪圖指令
+    doc.beginForm('label_normal')
+    draw_label(False)
+    doc.endForm()
+    if is_new_batch:
+        doc.beginForm('label_first')
+        draw_label(True)
+        doc.endForm()
+    
+    # 繪製每一頁標籤
+    for i in range(quantity):
+        print(f"正在生成第 {i+1} 張標籤...")
         
-        # 出庫人員和日期（留白給蓋章用，粗體）
-        doc.setFont(font_name, 8)
-        doc.drawString(2*mm, 4*mm, "人員：")
-        doc.drawString(25*mm, 4*mm, "出庫日期：")
+        # 只有第一張標籤是新批號格式（當is_new_batch為True時）
+        doc.doForm('label_first' if is_new_batch and i == 0 else 'label_normal')
         
         # 如果不是最後一頁，則新增頁面
         if i < quantity - 1:
@@ -1458,10 +2092,10 @@ def generate_pdf_labels(entry, quantity=None, is_new_batch=False):
     
     # 儲存PDF
     doc.save()
-    print(f"標籤生成完成，檔案位置: {temp_file.name}")
+    print(f"標籤生成完成，檔案位置: {pdf_path}")
     
     try:
-        print(f"已生成 {quantity} 張標籤PDF: {temp_file.name}")
+        print(f"已生成 {quantity} 張標籤PDF: {pdf_path}")
         
         if WINDOWS_PRINT_AVAILABLE:
             print("正在嘗試直接列印...")
@@ -1483,7 +2117,7 @@ def generate_pdf_labels(entry, quantity=None, is_new_batch=False):
                         sumatra_path, 
                         "-print-to-default", 
                         "-silent",
-                        temp_file.name
+                        pdf_path
                     ], check=True, timeout=30)
                     print("SumatraPDF 靜默列印命令已發送")
                     print("注意：如果列印方向不正確，請在印表機驅動設定中關閉自動旋轉功能")
@@ -1496,11 +2130,11 @@ def generate_pdf_labels(entry, quantity=None, is_new_batch=False):
                     print(f"警告：SumatraPDF 列印發生錯誤: {e}")
             
             # 如果 SumatraPDF 不可用，嘗試使用 Adobe Reader
-            adobe_path = r"C:\Program Files (x86)\Adobe\Acrobat Reader DC\Reader\AcroRd32.exe"
-            if os.path.exists(adobe_path):
+            adobe_path = find_adobe_reader()
+            if adobe_path:
                 print("使用Adobe Reader列印...")
                 try:
-                    subprocess.run([adobe_path, "/T", temp_file.name, default_printer], 
+                    subprocess.run([adobe_path, "/T", pdf_path, default_printer], 
                                   check=True, timeout=30)
                     print("Adobe Reader 列印命令已發送")
                     return quantity
@@ -1510,18 +2144,18 @@ def generate_pdf_labels(entry, quantity=None, is_new_batch=False):
             # 如果都不可用，使用系統預設方式（可能不是靜默列印）
             print("找不到支援靜默列印的PDF閱讀器，使用系統預設程式...")
             print("注意：此方式可能會顯示列印對話框")
-            win32api.ShellExecute(0, "print", temp_file.name, None, ".", 0)
+            win32api.ShellExecute(0, "print", pdf_path, None, ".", 0)
             print("列印命令已發送")
         else:
             print("Windows列印功能不可用，改為開啟PDF檔案")
             # 使用系統預設PDF查看器開啟
-            subprocess.Popen(['start', temp_file.name], shell=True)
+            open_with_default_app(pdf_path)
             print(f"PDF已開啟，請手動選擇列印或儲存")
     except Exception as e:
         print(f"列印失敗: {e}")
         print("改為開啟PDF檔案供手動列印")
         try:
-            subprocess.Popen(['start', temp_file.name], shell=True)
+            open_with_default_app(pdf_path)
         except:
             pass
     
@@ -1531,34 +2165,149 @@ def generate_pdf_labels(entry, quantity=None, is_new_batch=False):
 def test():
     return jsonify({'message': 'API測試成功', 'status': 'ok'})
 
+CSV_TEMPLATE_FILENAME = '試劑入庫紀錄_CSV範本.csv'
+
+def _load_csv_template():
+    """讀取CSV範本內容（檔案不存在時先建立），只在啟動時執行一次"""
+    template_path = os.path.join(APP_DIR, CSV_TEMPLATE_FILENAME)
+    
+    # 如果檔案不存在，創建一個
+    if not os.path.exists(template_path):
+        headers = ['試劑名稱', '試劑批號', '穩定效期', '數量', '單位', '供應商', '入庫日期']
+        sample_data = [
+            ['GOT', 'GOT001', '2025-12-31', '10', '組', '亞培', '2025-08-22 09:00:00'],
+            ['GPT', 'GPT001', '2025-12-31', '5', '組', '羅氏', '2025-08-22 10:00:00']
+        ]
+        
+        buffer = io.StringIO(newline='')
+        writer = csv.writer(buffer)
+        writer.writerow(headers)
+        writer.writerows(sample_data)
+        content = buffer.getvalue().encode('utf-8-sig')
+        
+        try:
+            with open(template_path, 'wb') as f:
+                f.write(content)
+        except OSError as e:
+            print(f"無法建立CSV範本檔案: {e}")
+        return content
+    
+    with open(template_path, 'rb') as f:
+        return f.read()
+
+_CSV_TEMPLATE_BYTES = _load_csv_template()
+_CSV_TEMPLATE_ETAG = hashlib.md5(_CSV_TEMPLATE_BYTES).hexdigest()
+CSV_TEMPLATE_MAX_AGE = 3600  # 秒
+
 @app.route('/api/csv-template')
 def download_csv_template():
     """下載CSV範本檔案"""
     try:
-        template_path = os.path.join(APP_DIR, '試劑入庫紀錄_CSV範本.csv')
-        
-        # 如果檔案不存在，創建一個
-        if not os.path.exists(template_path):
-            headers = ['試劑名稱', '試劑批號', '穩定效期', '數量', '單位', '供應商', '入庫日期']
-            sample_data = [
-                ['GOT', 'GOT001', '2025-12-31', '10', '組', '亞培', '2025-08-22 09:00:00'],
-                ['GPT', 'GPT001', '2025-12-31', '5', '組', '羅氏', '2025-08-22 10:00:00']
-            ]
-            
-            with open(template_path, 'w', encoding='utf-8-sig', newline='') as f:
-                import csv
-                writer = csv.writer(f)
-                writer.writerow(headers)
-                for row in sample_data:
-                    writer.writerow(row)
-        
-        return send_file(template_path, as_attachment=True, download_name='試劑入庫紀錄_CSV範本.csv')
+        # 範本內容在啟動時已固定，允許瀏覽器快取，並以 ETag 回應重新驗證
+        response = send_file(io.BytesIO(_CSV_TEMPLATE_BYTES), mimetype='text/csv',
+                             as_attachment=True, download_name=CSV_TEMPLATE_FILENAME,
+                             etag=_CSV_TEMPLATE_ETAG, max_age=CSV_TEMPLATE_MAX_AGE)
+        response.cache_control.public = True
+        return response
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+# 列印佇列：列印工作交給背景執行緒處理，請求不需等待印表機或 PDF 閱讀器
+PRINT_QUEUE_SIZE = 64
+_print_queue = queue.Queue(maxsize=PRINT_QUEUE_SIZE)
+_print_job_ids = itertools.count(1)
+_print_worker_thread = None
+_print_worker_lock = threading.Lock()
+# 列印工作狀態（queued / printing / done / failed），只保留最近的工作供前端查詢
+PRINT_JOB_HISTORY_SIZE = 256
+_print_job_status = OrderedDict()  # 列印工作 ID -> 狀態資料
+_print_job_status_lock = threading.Lock()
+
+def _set_print_job_status(job_id, status, **details):
+    """更新列印工作狀態（超過上限時移除最舊的工作）"""
+    with _print_job_status_lock:
+        _print_job_status[job_id] = {'job_id': job_id, 'status': status, **details}
+        _print_job_status.move_to_end(job_id)
+        while len(_print_job_status) > PRINT_JOB_HISTORY_SIZE:
+            _print_job_status.popitem(last=False)
+
+def _print_worker():
+    """背景列印執行緒：依序處理列印佇列中的工作"""
+    while True:
+        job = _print_queue.get()
+        try:
+            with app.app_context():
+                if 'items' in job:
+                    # 多筆記錄合併列印
+                    items = []
+                    for item in job['items']:
+                        entry = db.session.get(ReagentEntry, item['entry_id'])
+                        if entry is None:
+                            print(f"列印工作 {job['job_id']}: 找不到記錄ID {item['entry_id']}，略過")
+                            continue
+                        items.append((entry, item['quantity'], item['is_new_batch']))
+                    _set_print_job_status(job['job_id'], 'printing')
+                    labels_printed = generate_and_print_label_batch(items)
+                else:
+                    entry = db.session.get(ReagentEntry, job['entry_id'])
+                    if entry is None:
+                        print(f"列印工作 {job['job_id']} 失敗: 找不到記錄ID {job['entry_id']}")
+                        _set_print_job_status(job['job_id'], 'failed', error=f"找不到記錄ID {job['entry_id']}")
+                        continue
+                    _set_print_job_status(job['job_id'], 'printing')
+                    labels_printed = generate_and_print_labels(
+                        entry, job['quantity'], job['is_new_batch'], job['printer_type']
+                    )
+                print(f"列印工作 {job['job_id']} 完成: 已列印 {labels_printed} 張標籤")
+                _set_print_job_status(job['job_id'], 'done', labels_printed=labels_printed)
+        except Exception as e:
+            print(f"列印工作 {job['job_id']} 失敗: {e}")
+            _set_print_job_status(job['job_id'], 'failed', error=str(e))
+            import traceback
+            traceback.print_exc()
+        finally:
+            _print_queue.task_done()
+
+def _ensure_print_worker():
+    """確保背景列印執行緒已啟動（第一次列印時才啟動）"""
+    global _print_worker_thread
+    with _print_worker_lock:
+        if _print_worker_thread is None or not _print_worker_thread.is_alive():
+            _print_worker_thread = threading.Thread(target=_print_worker, name='print-worker', daemon=True)
+            _print_worker_thread.start()
+
+def _enqueue_print_job(job):
+    """將列印工作加入佇列，佇列已滿時返回 False
+    
+    - 單筆記錄：{'job_id', 'entry_id', 'quantity', 'is_new_batch', 'printer_type'}
+    - 多筆記錄：{'job_id', 'items': [{'entry_id', 'quantity', 'is_new_batch'}, ...]}
+    """
+    job_id = job['job_id']
+    _ensure_print_worker()
+    # 先記錄狀態再加入佇列，避免背景執行緒已開始列印後被覆寫為 queued
+    _set_print_job_status(job_id, 'queued')
+    try:
+        _print_queue.put_nowait(job)
+    except queue.Full:
+        print(f"列印佇列已滿，拒絕列印工作 {job_id}")
+        with _print_job_status_lock:
+            _print_job_status.pop(job_id, None)
+        return False
+    return True
+
+@app.route('/api/print-status/<int:job_id>', methods=['GET'])
+def get_print_status(job_id):
+    """查詢列印工作狀態"""
+    with _print_job_status_lock:
+        status = _print_job_status.get(job_id)
+        status = dict(status) if status is not None else None
+    if status is None:
+        return jsonify({'error': '找不到列印工作'}), 404
+    return jsonify(status)
+
 @app.route('/api/print-direct/<int:entry_id>', methods=['POST'])
 def print_direct(entry_id):
-    """直接列印到預設印表機"""
+    """直接列印到預設印表機（加入列印佇列後立即返回）"""
     try:
         entry = ReagentEntry.query.get_or_404(entry_id)
         data = request.json
@@ -1569,99 +2318,169 @@ def print_direct(entry_id):
         # 如果前端沒有明確指定is_new_batch，則自動檢查
         if not is_new_batch:
             # 檢查此批號是否為第一次入庫（即是否為新批號）
-            earliest_entry = ReagentEntry.query.filter_by(
-                reagent_name=entry.reagent_name,
-                reagent_batch_number=entry.reagent_batch_number
-            ).order_by(ReagentEntry.entry_date.asc()).first()
+            earliest_id = _get_earliest_entry_id(entry.reagent_name, entry.reagent_batch_number)
             
             # 如果當前記錄就是最早的記錄，說明是新批號
-            if earliest_entry and earliest_entry.id == entry.id:
+            if earliest_id == entry.id:
                 is_new_batch = True
         
-        print(f"直接列印請求: 記錄ID {entry_id}, 數量 {quantity}, 新批號: {is_new_batch}, 標籤機類型: {printer_type}")
+        job_id = next(_print_job_ids)
+        print(f"直接列印請求: 記錄ID {entry_id}, 數量 {quantity}, 新批號: {is_new_batch}, 標籤機類型: {printer_type}, 列印工作 {job_id}")
         
-        # 根據列印模式選擇對應的列印函數
-        labels_printed = generate_and_print_labels(entry, quantity, is_new_batch, printer_type)
+        # 加入列印佇列，由背景執行緒列印
+        if not _enqueue_print_job({
+            'job_id': job_id,
+            'entry_id': entry.id,
+            'quantity': quantity,
+            'is_new_batch': is_new_batch,
+            'printer_type': printer_type
+        }):
+            return jsonify({
+                'success': False,
+                'message': '列印佇列已滿，請稍後再試'
+            }), 429
         
         return jsonify({
             'success': True,
-            'message': f'已列印 {labels_printed} 張標籤'
-        })
+            'queued': True,
+            'job_id': job_id,
+            'message': f'已加入列印佇列：{quantity} 張標籤'
+        }), 202
             
     except Exception as e:
         print(f"列印失敗: {e}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/print-batch', methods=['POST'])
+def print_batch():
+    """多筆記錄合併為一個列印工作（加入列印佇列後立即返回）
+    
+    請求格式：{"items": [{"entry_id": 1, "quantity": 2}, ...]}，quantity 省略時使用記錄的數量
+    """
+    try:
+        data = request.json or {}
+        items = data.get('items') or []
+        if not items:
+            return jsonify({'error': '沒有選擇要列印的記錄'}), 400
+        
+        job_items = []
+        total_quantity = 0
+        for item in items:
+            entry = db.session.get(ReagentEntry, item.get('entry_id'))
+            if entry is None:
+                return jsonify({'error': f"找不到記錄ID {item.get('entry_id')}"}), 404
+            quantity = item.get('quantity', entry.quantity)
+            # 與直接列印相同：此記錄為該批號最早的入庫記錄時即為新批號
+            is_new_batch = item.get('is_new_batch', False) or (
+                _get_earliest_entry_id(entry.reagent_name, entry.reagent_batch_number) == entry.id
+            )
+            job_items.append({'entry_id': entry.id, 'quantity': quantity, 'is_new_batch': is_new_batch})
+            total_quantity += quantity
+        
+        job_id = next(_print_job_ids)
+        print(f"批次列印請求: {len(job_items)} 筆記錄, 共 {total_quantity} 張, 列印工作 {job_id}")
+        
+        # 加入列印佇列，由背景執行緒一次列印
+        if not _enqueue_print_job({'job_id': job_id, 'items': job_items}):
+            return jsonify({
+                'success': False,
+                'message': '列印佇列已滿，請稍後再試'
+            }), 429
+        
+        return jsonify({
+            'success': True,
+            'queued': True,
+            'job_id': job_id,
+            'message': f'已加入列印佇列：{len(job_items)} 筆記錄，共 {total_quantity} 張標籤'
+        }), 202
+        
+    except Exception as e:
+        print(f"批次列印失敗: {e}")
+        return jsonify({'error': str(e)}), 500
+
+def _build_preview_pdf():
+    """產生預覽標籤 PDF（使用固定的示例入庫記錄）"""
+    # 創建一個示例入庫記錄
+    
+    class MockEntry:
+        def __init__(self):
+            self.reagent_name = "AFP"
+            self.reagent_batch_number = "AFP001"
+            self.expiry_date = date(2025, 8, 31)
+            self.quantity = 1
+            self.unit = "組"
+            self.supplier = "亞培"
+            self.entry_date = datetime(2025, 8, 20)
+    
+    mock_entry = MockEntry()
+    
+    # 生成標籤PDF（直接寫入記憶體，不需暫存檔）
+    pdf_buffer = io.BytesIO()
+    c = canvas.Canvas(pdf_buffer, pagesize=(PDF_LABEL_WIDTH, PDF_LABEL_HEIGHT))
+    
+    # 獲取中文字體
+    font_name = get_chinese_font()
+    
+    # 標籤邊框
+    c.rect(1*mm, 1*mm, 48*mm, 33*mm)
+    
+    # 標籤文字
+    _draw_label_text(
+        c, font_name,
+        f"試劑名稱：{mock_entry.reagent_name}",
+        f"試劑批號：{mock_entry.reagent_batch_number} (允收合格)",
+        f"穩定效期：{mock_entry.expiry_date.strftime('%Y/%m/%d')}",
+        f"入庫時間：{mock_entry.entry_date.strftime('%Y/%m/%d')}"
+    )
+    
+    c.save()
+    return pdf_buffer.getvalue()
+
+# 預覽標籤內容固定，只在第一次預覽時產生一次：(PDF 內容, ETag)
+_preview_pdf = None
+_preview_pdf_lock = threading.Lock()
+PREVIEW_MAX_AGE = 3600  # 秒
+
+def _get_preview_pdf():
+    """取得預覽標籤 PDF 與其 ETag（第一次使用時才產生）"""
+    global _preview_pdf
+    with _preview_pdf_lock:
+        if _preview_pdf is None:
+            pdf_bytes = _build_preview_pdf()
+            _preview_pdf = (pdf_bytes, hashlib.md5(pdf_bytes).hexdigest())
+        return _preview_pdf
+
 @app.route('/preview-label')
 def preview_label():
     """預覽標籤版面"""
     try:
-        # 創建一個示例入庫記錄
-        
-        class MockEntry:
-            def __init__(self):
-                self.reagent_name = "AFP"
-                self.reagent_batch_number = "AFP001"
-                self.expiry_date = date(2025, 8, 31)
-                self.quantity = 1
-                self.unit = "組"
-                self.supplier = "亞培"
-                self.entry_date = datetime(2025, 8, 20)
-        
-        mock_entry = MockEntry()
+        pdf_bytes, etag = _get_preview_pdf()
         
-        # 生成標籤PDF
-        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.pdf')
-        c = canvas.Canvas(temp_file.name, pagesize=(50*mm, 35*mm))
-        
-        # 獲取中文字體
-        font_name = get_chinese_font()
-        
-        # 標籤邊框
-        c.rect(1*mm, 1*mm, 48*mm, 33*mm)
-        
-        # 標題（粗體）
-        c.setFont(font_name, 10)
-        c.drawString(2*mm, 29*mm, "【入庫】")
-        
-        # 入庫資料（垂直排列，粗體）
-        c.setFont(font_name, 8)
-        c.drawString(2*mm, 25*mm, f"試劑名稱：{mock_entry.reagent_name}")
-        c.drawString(2*mm, 21*mm, f"試劑批號：{mock_entry.reagent_batch_number} (允收合格)")
-        c.drawString(2*mm, 17*mm, f"穩定效期：{mock_entry.expiry_date.strftime('%Y/%m/%d')}")
-        c.drawString(2*mm, 13*mm, f"入庫時間：{mock_entry.entry_date.strftime('%Y/%m/%d')}")
-        
-        # 出庫標題（粗體）
-        c.setFont(font_name, 10)
-        c.drawString(2*mm, 8*mm, "【出庫】")
-        
-        # 出庫人員和日期（留白給蓋章用，粗體）
-        c.setFont(font_name, 8)
-        c.drawString(2*mm, 4*mm, "人員：")
-        c.drawString(25*mm, 4*mm, "出庫日期：")
-        
-        c.save()
-        
-        # 返回PDF文件
-        return send_file(temp_file.name, as_attachment=True, download_name='label_preview.pdf')
+        # 返回PDF文件（預覽內容固定，允許瀏覽器快取，並以 ETag 回應重新驗證）
+        response = send_file(io.BytesIO(pdf_bytes), mimetype='application/pdf',
+                             as_attachment=True, download_name='label_preview.pdf',
+                             etag=etag, max_age=PREVIEW_MAX_AGE)
+        response.cache_control.public = True
+        return response
         
     except Exception as e:
         print(f"預覽標籤失敗: {e}")
         return jsonify({'error': str(e)}), 500
 
 if __name__ == '__main__':
-    import threading
-    import time
     import webbrowser
     
-    # 建立資料庫
-    with app.app_context():
-        db.create_all()
-        print(f"資料庫路徑: {DB_PATH}")
+    print(f"資料庫路徑: {DB_PATH}")
     
     def open_browser():
-        """延遲3秒後開啟瀏覽器"""
-        time.sleep(3)
+        """等伺服器開始接受連線後立即開啟瀏覽器（最多等待約10秒）"""
+        deadline = time.monotonic() + 10
+        while time.monotonic() < deadline:
+            try:
+                with socket.create_connection(('127.0.0.1', 5000), timeout=0.1):
+                    break
+            except OSError:
+                time.sleep(0.05)
         webbrowser.open('http://127.0.0.1:5000')
     
     # 在背景開啟瀏覽器
@@ -1675,6 +2494,10 @@ if __name__ == '__main__':
     print("按 Ctrl+C 停止系統")
     
     try:
-        app.run(debug=False, host='127.0.0.1', port=5000, use_reloader=False)
+        if WAITRESS_AVAILABLE:
+            # 以執行緒池同時處理多個請求（列印、查詢、預覽不會互相等待）
+            waitress_serve(app, host='127.0.0.1', port=5000, threads=8, ident='RStorage')
+        else:
+            app.run(debug=False, host='127.0.0.1', port=5000, use_reloader=False, threaded=True)
     except KeyboardInterrupt:
         print("\n系統已停止")